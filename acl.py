@@ -0,0 +1,103 @@
+import fnmatch
+import re
+import threading
+from enum import IntFlag
+
+from snapshot import Unpicklable
+
+
+class Role(IntFlag):
+    USER = 0
+    BLACKLISTED = 1
+    WHITELISTED = 2
+    ALT_TRADER = 4
+
+
+class AccessControl(Unpicklable):
+    """
+    Answers "what role is this user" from the config lists in one lookup.
+
+    Exact names live in sets. Blacklist entries containing * or ? and the extra ban patterns
+    (substring bans are written *name*) are compiled into a single regex. Verdicts are cached per
+    username and the cache is dropped whenever a list changes.
+    """
+    WILDCARDS = ("*", "?", "[")
+    CACHE_LIMIT = 50000
+    TRANSIENT = {"_lock": threading.Lock, "_cache": dict}
+
+    def __init__(self, blacklist=(), whitelist=(), alttraderlist=(), ban_patterns=()):
+        self._lock = threading.Lock()
+        self._names = {Role.BLACKLISTED: set(), Role.WHITELISTED: set(), Role.ALT_TRADER: set()}
+        self._patterns = set(ban_patterns)
+        self._matcher = None
+        self._cache = {}
+        for role, members in ((Role.BLACKLISTED, blacklist), (Role.WHITELISTED, whitelist),
+                              (Role.ALT_TRADER, alttraderlist)):
+            for name in members:
+                self._insert(role, name)
+        self._compile()
+
+    def role(self, username):
+        # A list change swaps in a new cache after updating the lists, so a verdict resolved from
+        # the old lists must only ever go into the cache that was current before resolving
+        cache = self._cache
+        verdict = cache.get(username)
+        if verdict is None:
+            verdict = self._resolve(username)
+            if len(cache) >= self.CACHE_LIMIT:
+                cache.clear()
+            cache[username] = verdict
+        return verdict
+
+    def is_blacklisted(self, username):
+        return bool(self.role(username) & Role.BLACKLISTED)
+
+    def is_whitelisted(self, username):
+        return bool(self.role(username) & Role.WHITELISTED)
+
+    def is_alt_trader(self, username):
+        return bool(self.role(username) & Role.ALT_TRADER)
+
+    def add(self, role, name):
+        with self._lock:
+            if self._insert(role, name):
+                self._compile()
+            self._cache = {}
+
+    def remove(self, role, name):
+        with self._lock:
+            if role == Role.BLACKLISTED and self._is_pattern(name):
+                self._patterns.discard(name)
+                self._compile()
+            else:
+                self._names[role].discard(name)
+            self._cache = {}
+
+    def _resolve(self, username):
+        verdict = Role.USER
+        for role, names in self._names.items():
+            if username in names:
+                verdict |= role
+        matcher = self._matcher
+        if matcher is not None and matcher.fullmatch(username):
+            verdict |= Role.BLACKLISTED
+        return verdict
+
+    def _insert(self, role, name):
+        """
+        Returns True if the name was a pattern and the matcher needs recompiling.
+        """
+        if role == Role.BLACKLISTED and self._is_pattern(name):
+            self._patterns.add(name)
+            return True
+        self._names[role].add(name)
+        return False
+
+    def _is_pattern(self, name):
+        return any(char in name for char in self.WILDCARDS)
+
+    def _compile(self):
+        if self._patterns:
+            self._matcher = re.compile("|".join(fnmatch.translate(p) for p in sorted(self._patterns)), re.DOTALL)
+        else:
+            self._matcher = None
@@ -0,0 +1,74 @@
+"""
+Per-frame ingest cost of ChatHistory and the latency of ?seen / ?lastsaid lookups.
+
+    python benchmarks/bench_history.py [--frames 1000000] [--size 10000] [--spill]
+
+Frames are synthetic chat from a mix of regulars and passers-by. Ingest is timed once the ring is
+full, so every message also pays for evicting the one it replaces (and writing it out with
+--spill). Lookups are timed against the full ring.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from history import ChatHistory
+
+
+def make_chat(count, players, seed=1):
+    rng = random.Random(seed)
+    words = ["anyone", "selling", "bones", "gg", "lol", "where", "is", "the", "boss", "mining", "xp",
+             "buying", "logs", "how", "do", "i", "get", "to", "castle", "ty"]
+    regulars = max(players // 100, 1)
+    chat = []
+    for _ in range(count):
+        player = rng.randint(1, regulars) if rng.random() < 0.7 else rng.randint(1, players)
+        chat.append((f"player{player}", " ".join(rng.choice(words) for _ in range(rng.randint(2, 12)))))
+    return chat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=1000000)
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=50000)
+    parser.add_argument("--spill", action="store_true", help="spill evicted messages to a temporary file")
+    args = parser.parse_args()
+
+    chat = make_chat(args.frames, args.players)
+    with tempfile.TemporaryDirectory() as directory:
+        history = ChatHistory(args.size, os.path.join(directory, "chat.spill") if args.spill else None)
+        add = history.add
+        for username, message in chat[:args.size]:
+            add(username, message)
+        started = time.perf_counter()
+        for username, message in chat[args.size:]:
+            add(username, message)
+        elapsed = time.perf_counter() - started
+        print(f"{args.frames - args.size} messages into a ring of {args.size}"
+              f"{' with spill' if args.spill else ''}: {elapsed / (args.frames - args.size) * 1e6:.2f} us each, "
+              f"{len(history.by_user)} users and {len(history.by_token)} words indexed")
+
+        rng = random.Random(2)
+        queries = [(f"player{rng.randint(1, args.players // 100)}", rng.choice(["bones", "castle", "ty", None]))
+                   for _ in range(100000)]
+        started = time.perf_counter()
+        found = sum(history.last_said(username, word) is not None for username, word in queries)
+        elapsed = time.perf_counter() - started
+        print(f"{len(queries)} lookups by regulars: {elapsed / len(queries) * 1e6:.2f} us each, {found} found")
+        if args.spill:
+            gone = [username for username in history._spilled if username not in history.by_user][:10000]
+            started = time.perf_counter()
+            found = sum(history.last_said(username) is not None for username in gone)
+            elapsed = time.perf_counter() - started
+            print(f"{len(gone)} lookups from the spill file: {elapsed / max(len(gone), 1) * 1e6:.2f} us each, "
+                  f"{found} found")
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Memory and frames/sec for per-player state, over synthetic chat from many more players than the
+store keeps.
+
+    python benchmarks/bench_players.py [--frames 1000000] [--players 200000] [--max-players 20000]
+
+Two baselines, neither of which kept any per-player state: the original on_chat, which built a
+details dict for every frame and dropped it, and the handler just before PlayerStore, which only
+sliced out the username and message. Memory is what tracemalloc sees still allocated after the
+run, so it is the state left behind, not the frames themselves.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import WebSocketHandler
+from players import PlayerStore
+
+
+class DictRouter:
+    """
+    The original on_chat: a details dict per frame, thrown away afterwards.
+    """
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+
+    def on_chat(self, message, start):
+        raw_split = message.replace("CHAT=", "").split("~")
+        player_details = {
+            "username": raw_split[0], "sigil": raw_split[1], "tag": raw_split[2], "level": raw_split[3]}
+        player_message = raw_split[4]
+        username = player_details["username"]
+        if player_message.startswith("?"):
+            player_message = player_message.lstrip("?")
+            try:
+                command_name, command_arg = player_message.split(" ", 1)
+            except:
+                command_name, command_arg = player_message, ""
+            self.dispatch(command_name.lower(), username, command_arg)
+        elif "wikisearch is a good boy" in player_message.lower():
+            self.dispatch("woof", username)
+
+
+class SliceRouter:
+    """
+    on_chat just before PlayerStore: the username and message sliced out, nothing kept.
+    """
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+
+    def on_chat(self, message, start):
+        cut = start - 1
+        for _ in range(4):
+            cut = message.find("~", cut + 1)
+            if cut == -1:
+                raise ValueError("Malformed CHAT frame")
+        player_message = message[cut + 1:]
+        if player_message.startswith("?"):
+            player_message = player_message.lstrip("?")
+            try:
+                command_name, command_arg = player_message.split(" ", 1)
+            except:
+                command_name, command_arg = player_message, ""
+            self.dispatch(command_name.lower(), message[start:message.find("~", start)], command_arg)
+        elif "wikisearch is a good boy" in player_message.lower():
+            self.dispatch("woof", message[start:message.find("~", start)])
+
+
+def no_dispatch(*args):
+    pass
+
+
+def make_frames(count, players, seed=1):
+    rng = random.Random(seed)
+    sigils = ["none", "none", "none", "halloween_2023", "santa_hat", "crown"]
+    tags = ["none", "none", "donor", "investor", "moderator"]
+    words = ["anyone", "selling", "bones", "gg", "lol", "where", "is", "the", "boss", "mining", "xp"]
+    frames = []
+    regulars = max(players // 100, 1)
+    for _ in range(count):
+        # A few regulars do most of the talking, with a long tail of players seen once or twice
+        player = rng.randint(1, regulars) if rng.random() < 0.7 else rng.randint(1, players)
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(2, 12)))
+        frames.append(f"CHAT=player{player}~{sigils[player % len(sigils)]}~{tags[player % len(tags)]}~"
+                      f"{3 + player % 2000}~{text}")
+    return frames
+
+
+def ingest(router, frames):
+    on_chat = router.on_chat
+    started = time.perf_counter()
+    for frame in frames:
+        on_chat(frame, 5)
+    return time.perf_counter() - started
+
+
+def handler(max_players):
+    table = WebSocketHandler(no_dispatch, "", "", players=PlayerStore(max_players))
+    table.submit = no_dispatch
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=1000000)
+    parser.add_argument("--players", type=int, default=200000)
+    parser.add_argument("--max-players", type=int, default=20000)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.players)
+    distinct = len({frame[5:frame.index("~")] for frame in frames})
+    print(f"{args.frames} chat frames from {distinct} players, store capped at {args.max_players}")
+
+    routers = (("dict per frame", lambda: DictRouter(no_dispatch)),
+               ("slices, no state", lambda: SliceRouter(no_dispatch)),
+               ("PlayerStore", lambda: handler(args.max_players)))
+    for name, make in routers:
+        elapsed = min(ingest(make(), frames) for _ in range(2))
+        router = make()
+        tracemalloc.start()
+        ingest(router, frames)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        players = getattr(router, "players", None)
+        kept = len(players) if players is not None else 0
+        print(f"{name:>16}: {args.frames / elapsed:,.0f} frames/sec, {kept} players kept, "
+              f"{retained / 2 ** 20:.1f} MiB retained, peak {peak / 2 ** 20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Frames/sec for the old substring-chain router against the opcode table in WebSocketHandler.
+
+    python benchmarks/bench_router.py [frames]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import WebSocketHandler
+
+
+class LegacyRouter:
+    """
+    The router as it was before the opcode table, kept here as the baseline.
+    """
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+
+    def on_ws_message(self, ws, message):
+        if "CHAT=" in message:
+            self.on_chat(message)
+        elif "CUSTOM=" in message:
+            self.on_custom(message)
+        elif "SET_ITEMS=" in message:
+            pass
+        elif "YELL=" in message:
+            pass
+        elif "EVENT_GLOBAL_PROGRESS=" in message:
+            pass
+        else:
+            print(message)
+
+    def on_chat(self, message):
+        raw_split = message.replace("CHAT=", "").split("~")
+        player_details = {
+            "username": raw_split[0], "sigil": raw_split[1], "tag": raw_split[2], "level": raw_split[3]}
+        player_message = raw_split[4]
+        username = player_details["username"]
+        if player_message.startswith("?"):
+            player_message = player_message.lstrip("?")
+            try:
+                command_name, command_arg = player_message.split(" ", 1)
+            except:
+                command_name, command_arg = player_message, ""
+            self.dispatch(command_name.lower(), username, command_arg)
+        elif "wikisearch is a good boy" in player_message.lower():
+            self.dispatch("woof", username)
+
+    def on_custom(self, message):
+        raw_split = message.replace("CUSTOM=", "").split("~")
+        username = raw_split[0]
+        player_message = raw_split[1].split("interactor:")[1]
+        try:
+            command_name, command_arg = player_message.split(":", 1)
+        except:
+            command_name, command_arg = player_message, ""
+        self.dispatch(command_name.lower(), username, command_arg)
+
+
+def make_frames(count, seed=1):
+    rng = random.Random(seed)
+    items = "~".join(f"item_{i}~{rng.randint(0, 10 ** 9)}" for i in range(600))
+    progress = "~".join(str(rng.randint(0, 10 ** 6)) for _ in range(300))
+    words = ["anyone", "selling", "bones", "gg", "lol", "where", "is", "the", "boss", "mining", "xp"]
+    frames = []
+    for _ in range(count):
+        roll = rng.random()
+        name = f"player{rng.randint(1, 500)}"
+        if roll < 0.4:
+            frames.append(f"SET_ITEMS={items}")
+        elif roll < 0.6:
+            frames.append(f"EVENT_GLOBAL_PROGRESS={progress}")
+        elif roll < 0.9:
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(2, 12)))
+            frames.append(f"CHAT={name}~none~none~{rng.randint(3, 2000)}~{text}")
+        else:
+            frames.append(f"CHAT={name}~none~none~{rng.randint(3, 2000)}~?wiki {rng.choice(words)}")
+    return frames
+
+
+def run(router, frames):
+    on_message = router.on_ws_message
+    started = time.perf_counter()
+    for frame in frames:
+        on_message(None, frame)
+    return len(frames) / (time.perf_counter() - started)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    frames = make_frames(count)
+    print(f"{count} frames, {sum(map(len, frames)) / count:.0f} bytes average")
+
+    def no_dispatch(*args):
+        pass
+
+    legacy = LegacyRouter(no_dispatch)
+    table = WebSocketHandler(no_dispatch, "", "")
+    table.submit = no_dispatch
+
+    for name, router in (("substring chain", legacy), ("opcode table", table)):
+        best = max(run(router, frames) for _ in range(3))
+        print(f"{name:>16}: {best:,.0f} frames/sec")
+
+
+if __name__ == "__main__":
+    main()
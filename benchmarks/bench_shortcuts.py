@@ -0,0 +1,71 @@
+"""
+?wiki shortcut lookups: the old quote-and-dict path against ShortcutIndex.
+
+    python benchmarks/bench_shortcuts.py [keys]
+"""
+import os
+import random
+import string
+import sys
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from shortcuts import ShortcutIndex
+
+
+def dict_lookup(shortcuts, search_term):
+    search_term = urllib.parse.quote(search_term)
+    if search_term in shortcuts:
+        search_term = urllib.parse.quote(shortcuts[search_term])
+    return f"https://idle-pixel.wiki/index.php?search={search_term}"
+
+
+def make_keys(count, rng):
+    keys = set()
+    while len(keys) < count:
+        keys.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 14))))
+    return sorted(keys)
+
+
+def typo(word, rng):
+    at = rng.randrange(len(word))
+    return word[:at] + rng.choice(string.ascii_lowercase) + word[at + 1:]
+
+
+def per_call(func, terms, rounds=3):
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for term in terms:
+            func(term)
+        best = min(best, (time.perf_counter() - started) / len(terms))
+    return best * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(7)
+    keys = make_keys(count, rng)
+    shortcuts = {key: key.title() for key in keys}
+
+    started = time.perf_counter()
+    index = ShortcutIndex(shortcuts)
+    print(f"{count} keys, index built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    exact = rng.sample(keys, 2000)
+    prefixes = [key[:max(ShortcutIndex.MIN_PREFIX, len(key) - 2)] for key in rng.sample(keys, 2000)]
+    typos = [typo(key, rng) for key in rng.sample(keys, 500)]
+    misses = ["".join(rng.choice(string.ascii_lowercase) for _ in range(9)) for _ in range(500)]
+
+    print(f"{'query':>8} {'dict us':>9} {'index us':>9} {'dict hits':>10} {'index hits':>11}")
+    for name, terms in (("exact", exact), ("prefix", prefixes), ("typo", typos), ("miss", misses)):
+        dict_hits = sum(urllib.parse.quote(term) in shortcuts for term in terms)
+        index_hits = sum(index.resolve(term, fuzzy=True) is not None for term in terms)
+        print(f"{name:>8} {per_call(lambda t: dict_lookup(shortcuts, t), terms):9.2f} "
+              f"{per_call(lambda t: index.url_for(t, fuzzy=True), terms):9.2f} {dict_hits:10} {index_hits:11}")
+
+
+if __name__ == "__main__":
+    main()
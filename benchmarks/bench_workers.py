@@ -0,0 +1,122 @@
+"""
+Command throughput on threads against worker processes, for a CPU-bound command and a trivial one.
+
+    python benchmarks/bench_workers.py [--commands 400] [--keys 2000] [--workers 1 2 4]
+
+The CPU-bound command is a "did you mean" scan: the edit distance from the search term to every
+shortcut, the kind of fuzzy matching that holds the GIL. The trivial one only replies, so what it
+measures is the cost of getting a rate limited command to a worker and back. The bot runs against
+a temporary config, and replies are counted rather than sent.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import WikiBot
+from registry import command
+from shortcuts import edit_distance
+
+
+@command("scan", rate_limit=True, log=False)
+def wikiscan(bot, username, term):
+    best = min(bot.shortcuts, key=lambda key: edit_distance(term, key, 4))
+    bot.send_response(f"Did you mean {best}?")
+
+
+@command("ping", rate_limit=True, log=False)
+def wikiping(bot, username, term):
+    bot.send_response("pong")
+
+
+class ScanBot(WikiBot):
+    def __init__(self):
+        super().__init__()
+        self.register_command("scan", wikiscan)
+        self.register_command("ping", wikiping)
+
+
+class Counter:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, message):
+        self.sent += 1
+
+
+def write_config(path, keys, rng):
+    shortcuts = {}
+    while len(shortcuts) < keys:
+        key = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12)))
+        shortcuts[key] = key.title()
+    with open(path, "w") as f:
+        json.dump({
+            "blacklist": [], "whitelist": [], "alttraderlist": [], "shortcuts": shortcuts,
+            "config_user": "", "config_pass": "", "metrics_port": 0,
+            "rate_limits": {"classes": {"default": {"user": [1000000, 60], "command": [1000000, 60]}},
+                            "global": [1000000, 60]},
+            "logging": {"file": os.path.join(os.path.dirname(path), "bot_log.log"), "levels": {"wikibot": "WARNING"}},
+        }, f)
+    return list(shortcuts)
+
+
+async def run(bot, terms, command_name):
+    counter = Counter()
+    started = time.perf_counter()
+    await asyncio.gather(*(bot.dispatch_async(command_name, f"user{index % 50}", term, origin=counter)
+                           for index, term in enumerate(terms)))
+    elapsed = time.perf_counter() - started
+    assert counter.sent == len(terms), (counter.sent, len(terms))
+    return len(terms) / elapsed
+
+
+async def on_threads(bot, workers, terms):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=workers))
+    return await run(bot, terms, "scan"), await run(bot, terms, "ping")
+
+
+async def on_processes(bot, workers, terms):
+    bot.worker_processes = workers
+    bot.shared_state_path = os.path.join(os.path.dirname(WikiBot.CONFIG_PATH), f"state{workers}.sqlite")
+    bot.start_workers()
+    try:
+        # Let every process start before the clock does
+        await asyncio.gather(*(bot.dispatch_async("scan", "warmup", "x", origin=Counter()) for _ in range(workers * 4)))
+        return await run(bot, terms, "scan"), await run(bot, terms, "ping")
+    finally:
+        bot.workers.close()
+        bot.workers = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commands", type=int, default=400)
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    workdir = tempfile.mkdtemp(prefix="wikibot-workers-")
+    WikiBot.CONFIG_PATH = os.path.join(workdir, "config.json")
+    keys = write_config(WikiBot.CONFIG_PATH, args.keys, rng)
+    terms = [rng.choice(keys)[::-1] for _ in range(args.commands)]
+    print(f"{args.commands} scan commands over {args.keys} shortcuts, {os.cpu_count()} cores")
+
+    for workers in args.workers:
+        threads = asyncio.run(on_threads(ScanBot(), workers, terms))
+        processes = asyncio.run(on_processes(ScanBot(), workers, terms))
+        for name, on_thread, on_process in zip(("scan", "ping"), threads, processes):
+            print(f"{workers} workers, {name}: threads {on_thread:8.1f} commands/sec, "
+                  f"processes {on_process:8.1f} commands/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Replays a frame capture against WikiBot through a local stand-in for wss://server1.idle-pixel.com.
+
+Record a capture by setting "capture_file" in config.json, then:
+
+    python benchmarks/replay.py capture.gz --speed 10
+
+--speed 0 sends frames as fast as the bot will read them. The bot runs against a temporary copy
+of the config, so admin commands in the capture can't touch the real file.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import websockets
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from frames import FrameLog
+from main import WikiBot
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ReplayServer:
+    """
+    Accepts one bot connection, waits for its LOGIN frame and then plays the capture back to it,
+    counting whatever the bot sends in return.
+    """
+
+    def __init__(self, frames, speed):
+        self.frames = frames
+        self.speed = speed
+        self.outbound = Counter()
+        self.first_sent = None
+        self.last_sent = None
+        self.finished = asyncio.Event()
+
+    async def handle(self, ws):
+        login = await ws.recv()
+        if not login.startswith("LOGIN="):
+            await ws.close(1008, "expected LOGIN")
+            return
+        feeder = asyncio.create_task(self.feed(ws))
+        try:
+            async for message in ws:
+                self.outbound[message.split("=", 1)[0]] += 1
+        except websockets.ConnectionClosed:
+            pass
+        feeder.cancel()
+
+    async def feed(self, ws):
+        self.first_sent = time.perf_counter()
+        for index, (offset, frame) in enumerate(self.frames):
+            if self.speed:
+                delay = self.first_sent + offset / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif index % 256 == 0:
+                await asyncio.sleep(0)
+            await ws.send(frame)
+        self.last_sent = time.perf_counter()
+        self.finished.set()
+
+
+async def replay(args):
+    frames = list(FrameLog.read(args.capture))
+    if not frames:
+        print("Capture is empty")
+        return
+    first_offset = frames[0][0]
+    frames = [(offset - first_offset, frame) for offset, frame in frames]
+
+    workdir = tempfile.mkdtemp(prefix="wikibot-replay-")
+    WikiBot.CONFIG_PATH = os.path.join(workdir, "config.json")
+    shutil.copy(args.config, WikiBot.CONFIG_PATH)
+
+    server = ReplayServer(frames, args.speed)
+    async with websockets.serve(server.handle, "127.0.0.1", 0, max_size=None) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+
+        bot = WikiBot()
+        if not args.verbose:
+            logging.getLogger("wikibot").setLevel(logging.WARNING)
+        handler = bot.socket_handler
+        handler.URL = f"ws://127.0.0.1:{port}"
+        handler.capture = None
+        handler.signatures.seed("replay")
+        latencies = []
+        last_dispatch = [0.0]
+
+        def observe(command_name, seconds):
+            latencies.append(seconds)
+            last_dispatch[0] = time.perf_counter()
+
+        handler.dispatch_observer = observe
+        threading.Thread(target=handler.initialize_websocket, daemon=True).start()
+
+        await server.finished.wait()
+        # Give the dispatch pool time to work through whatever is still queued
+        settled = -1
+        while settled != (len(latencies), sum(server.outbound.values())):
+            settled = (len(latencies), sum(server.outbound.values()))
+            await asyncio.sleep(args.settle)
+
+    elapsed = max(server.last_sent, last_dispatch[0]) - server.first_sent
+    speed = f"{args.speed:g}x" if args.speed else "unthrottled"
+    print(f"Replayed {len(frames)} frames at {speed} in {elapsed:.2f}s: {len(frames) / elapsed:,.0f} frames/sec")
+    print(f"Commands dispatched: {len(latencies)}")
+    if latencies:
+        print("Dispatch latency (ms): " + ", ".join(
+            f"p{int(p * 100)} {percentile(latencies, p) * 1000:.2f}" for p in (0.5, 0.9, 0.99))
+            + f", max {max(latencies) * 1000:.2f}")
+    print("Outbound messages: " + (", ".join(f"{op} {count}" for op, count in server.outbound.most_common())
+                                   or "none"))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="frame capture written by capture_file")
+    parser.add_argument("--speed", type=float, default=1, help="playback speed, 0 for unthrottled")
+    parser.add_argument("--config", default="config.json", help="config to copy for the bot")
+    parser.add_argument("--settle", type=float, default=0.5,
+                        help="seconds without new replies before the run counts as finished")
+    parser.add_argument("--verbose", action="store_true", help="show the bot's own output")
+    asyncio.run(replay(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+_listener = None
+_forwarders = []
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Anything passed as extra={"fields": {...}} is merged in.
+    """
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RotatingJsonFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rolls the file over when it reaches `max_bytes` or has been open for `rotate_seconds`.
+    """
+
+    def __init__(self, filename, max_bytes, backup_count, rotate_seconds):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.rotate_seconds = rotate_seconds
+        self.opened_at = time.time()
+
+    def shouldRollover(self, record):
+        if self.rotate_seconds and time.time() - self.opened_at >= self.rotate_seconds:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
+
+def setup_logging(path="bot_log.log", levels=None, max_bytes=5 * 1024 * 1024, backup_count=5,
+                  rotate_seconds=86400, console_level="INFO"):
+    """
+    Routes all logging through a queue to a background thread that writes JSON lines to `path`
+    and a short human-readable line to the console, so callers never wait on I/O.
+    `levels` sets per-subsystem levels, e.g. {"wikibot.socket": "DEBUG"}.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    file_handler = RotatingJsonFileHandler(path, max_bytes, backup_count, rotate_seconds)
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(console_level)
+    console_handler.setFormatter(logging.Formatter("%(asctime)s %(name)s: %(message)s", "%H:%M:%S"))
+
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(logging.INFO)
+    logging.getLogger("websockets").setLevel(logging.WARNING)
+    for name, level in (levels or {}).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+
+def forward_logging(records):
+    """
+    Writes records that other processes put on the `records` queue through the same handlers.
+    """
+    if _listener is None:
+        return
+    forwarder = logging.handlers.QueueListener(records, *_listener.handlers, respect_handler_level=True)
+    forwarder.start()
+    _forwarders.append(forwarder)
+
+
+def stop_logging():
+    global _listener
+    while _forwarders:
+        _forwarders.pop().stop()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class EchoBatcher:
+    """
+    Collects debug echoes meant for the admin and sends them as one message every `interval`
+    seconds instead of one outbound frame each. Past `max_lines` in a batch, lines are only counted.
+    """
+
+    def __init__(self, send, interval=10, max_lines=10):
+        self.send = send
+        self.interval = interval
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+        self._lines = []
+        self._dropped = 0
+        self._timer = None
+
+    def add(self, line):
+        with self._lock:
+            if len(self._lines) < self.max_lines:
+                self._lines.append(line)
+            else:
+                self._dropped += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            lines, dropped = self._lines, self._dropped
+            self._lines, self._dropped, self._timer = [], 0, None
+        if not lines:
+            return
+        message = " | ".join(lines)
+        if dropped:
+            message += f" | (+{dropped} more)"
+        self.send(message)
@@ -0,0 +1,4 @@
+"""
+Command modules. Each declares its handlers with registry.command; list the modules to load under
+"command_modules" in config.json. ?reload re-imports them without dropping the connection.
+"""
@@ -0,0 +1,269 @@
+import logging
+import random
+
+from acl import Role
+from metrics import Metrics
+from registry import command, WHITELIST
+
+command_log = logging.getLogger("wikibot.commands")
+
+
+@command("add", access=WHITELIST)
+def wikiadd(bot, username, command_arg=""):
+    """
+    Adds a new shortcut for the wiki command. Requires a key:value format.
+    """
+    new_shortcut = command_arg.lower()
+    if ":" not in new_shortcut:
+        add_error = "Expected key:value, item not added"
+        bot.send_response(add_error)
+        return
+
+    new_key, new_item = new_shortcut.split(":")
+
+    if new_key == "zlef":
+        bot.send_response("Zlef has been added as a shortcut for awesome")
+        return
+    elif new_key == "cammy":
+        bot.send_response(f"{new_key} has been added as a shortcut for {new_item}")
+        return
+
+    if new_key in bot.shortcuts:
+        message = f"That key is already in use for {bot.shortcuts[new_key]}. Use ?keys to view the err... Keys..."
+        bot.send_response(message)
+        return
+
+    bot.store.set_item("shortcuts", new_key, new_item)
+    bot.shortcut_index.add(new_key, new_item)
+    bot.key_pages.add(new_key)
+    bot.link_cache.clear()
+    bot.send_response(f"{new_key} has been added as a shortcut for {new_item}")
+
+
+@command("remove", access=WHITELIST)
+def wikiremove(bot, username, command_arg=""):
+    """
+    Removes an existing shortcut from the wiki command list.
+    """
+    key_to_remove = command_arg.lower()
+    if key_to_remove not in bot.shortcuts:
+        bot.send_response(f"The key {key_to_remove} doesn't exist. Nothing to remove.")
+        return
+    if key_to_remove == "cammy":
+        bot.send_response(f"{key_to_remove} has been removed.")
+        return
+
+    bot.store.delete_item("shortcuts", key_to_remove)
+    bot.shortcut_index.remove(key_to_remove)
+    bot.key_pages.remove(key_to_remove)
+    bot.link_cache.clear()
+    confirmation = f"{key_to_remove} has been removed."
+    bot.send_response(confirmation)
+
+
+@command("keys", access=WHITELIST)
+def wikikeys(bot, username, command_arg=""):
+    """
+    Lists all current shortcut keys for the wiki command, with support for pagination.
+    Takes an optional page number and key prefix, e.g. ?keys 3 bow.
+    """
+    page_requested = 0
+    key_prefix = ""
+    for part in command_arg.lower().split():
+        if part.isdigit():
+            page_requested = int(part)
+        else:
+            key_prefix = part
+
+    total_pages = bot.key_pages.page_count(key_prefix)
+    if total_pages == 0:
+        bot.send_response(f"No keys start with {key_prefix}." if key_prefix else "There are no keys yet.")
+        return
+
+    if page_requested == 0:
+        if total_pages == 1:
+            page_requested = 1  # Set to first page if there's only one
+        else:
+            page_message = f'Use "?keys n" to specify a page. Currently, there are {total_pages} pages.'
+            bot.send_response(page_message)
+            return
+
+    page_requested = min(page_requested, total_pages)
+    bot.send_response(bot.key_pages.render(page_requested, key_prefix))
+
+
+@command("axe", access=WHITELIST)
+def wikiaxe(bot, username, command_arg=""):
+    """
+    Sends a random joke related to the 'Axe' character, avoiding repetition.
+    """
+    axe_jokes = [
+        "Axe is level 15 because otherwise he'd be too ostentatious and you wouldn't be able to play what with all the bowing and scraping",
+         "Shhhh, Lux is undercover as Axe to hide his moderator tag.",
+         "Now you've done it! Years of undercover work blown because you just had to know why the moderator has an alt account.",
+         "Axe at level 15 is like Bruce Wayne in a tracksuit—still dangerous but less showy.",
+         "Why does Axe stay at level 15? So he doesn't have to put 'Incognito Mode' in his username.",
+         "Smitty once tried to upgrade Axe to level 16, but the universe crashed. Took him a week to restore the balance."
+    ]
+    chosen_joke = random.choice(axe_jokes)
+    while chosen_joke == bot.last_axe_joke:
+        chosen_joke = random.choice(axe_jokes)
+    bot.last_axe_joke = chosen_joke
+    bot.send_response(chosen_joke)
+
+
+@command("say", access=WHITELIST)
+def wikisay(bot, username, command_arg=""):
+    """
+    Echoes back the given argument.
+    """
+    bot.send_response(command_arg)
+
+
+@command("custom", access=WHITELIST)
+def wikicustom(bot, username, command_arg=""):
+    """
+    Echoes back the given argument.
+    """
+    # bot.send_response(command_arg)
+
+    # bot.socket_handler.ws.send(f"CUSTOM={command_arg}")
+    bot.reply_handler().send("CUSTOM=botofnades~altTrader:info:ping")
+
+
+@command("woof", access=WHITELIST)
+def wikiwoof(bot, username, command_arg=""):
+    """
+    Responds to "wikisearch is a good boy" with "Woof!"
+    """
+    bot.send_response("Woof!")
+
+
+@command("wadd", access=WHITELIST)
+def wadd(bot, username, command_arg=""):
+    """
+    Adds a user to the whitelist, exclusive to 'zlef'.
+    """
+    if username == "zlef":
+        bot.store.add_member("whitelist", command_arg)
+        bot.acl.add(Role.WHITELISTED, command_arg)
+        bot.send_response(f"{command_arg} added to whitelist")
+
+
+@command("wremove", access=WHITELIST)
+def wremove(bot, username, command_arg=""):
+    """
+    Removes a user from the whitelist, exclusive to 'zlef'.
+    """
+    if username == "zlef":
+        bot.store.remove_member("whitelist", command_arg)
+        bot.acl.remove(Role.WHITELISTED, command_arg)
+        bot.send_response(f"{command_arg} removed from whitelist")
+
+
+@command("badd", access=WHITELIST)
+def badd(bot, username, command_arg=""):
+    """
+    Adds a user to the blacklist.
+    """
+    bot.store.add_member("blacklist", command_arg)
+    bot.acl.add(Role.BLACKLISTED, command_arg)
+    bot.send_response(f"{command_arg} added to blacklist")
+
+
+@command("bremove", access=WHITELIST)
+def bremove(bot, username, command_arg=""):
+    """
+    Removes a user from the blacklist.
+    """
+    bot.store.remove_member("blacklist", command_arg)
+    bot.acl.remove(Role.BLACKLISTED, command_arg)
+    bot.send_response(f"{command_arg} removed from blacklist")
+
+
+@command("limits", access=WHITELIST, in_process=True)
+def wikilimits(bot, username, command_arg=""):
+    """
+    Reports how many rate limited calls were served and throttled.
+    """
+    bot.send_response(bot.rate_limiter.summary(), True)
+
+
+@command("stats", access=WHITELIST, in_process=True)
+def wikistats(bot, username, command_arg=""):
+    """
+    Summarises frame, command, rejection and connection metrics for admins.
+    """
+    counters = bot.metrics.counters()
+    histograms = bot.metrics.histograms()
+    gauges = bot.metrics.gauges()
+
+    def labelled(name):
+        # Summed over connections, keyed by the first label
+        totals = {}
+        for (metric, labels), value in counters.items():
+            if metric == name and labels:
+                totals[labels[0][1]] = totals.get(labels[0][1], 0) + value
+        return sorted(totals.items(), key=lambda item: -item[1])
+
+    def total(source, name):
+        return sum(value for (metric, _), value in source.items() if metric == name)
+
+    frames = labelled("wikibot_frames_total")
+    commands = sorted(((labels[0][1], histogram) for (metric, labels), histogram in histograms.items()
+                       if metric == "wikibot_command_seconds"), key=lambda item: -sum(item[1][:-1]))
+    command_text = ", ".join(
+        f"{name} {sum(histogram[:-1])} (p50 {Metrics.quantile(histogram, 0.5) * 1000:g}ms, "
+        f"p99 {Metrics.quantile(histogram, 0.99) * 1000:g}ms)" for name, histogram in commands[:5])
+    flushes = histograms.get(("wikibot_config_flush_seconds", ()))
+    logins = [histogram for (metric, _), histogram in histograms.items() if metric == "wikibot_login_seconds"]
+    bot.send_response(
+        f"Frames {sum(count for _, count in frames)} ({', '.join(f'{op} {n}' for op, n in frames[:4])}). "
+        f"Commands: {command_text or 'none'}. "
+        f"Rejected: {', '.join(f'{reason} {n}' for reason, n in labelled('wikibot_rejections_total')) or 'none'}. "
+        f"Connections {len(bot.socket_handlers)}, "
+        f"outbound queue {total(gauges, 'wikibot_outbound_queue_depth')}, "
+        f"reconnects {total(counters, 'wikibot_reconnects_total')}, "
+        f"logins {sum(sum(h[:-1]) for h in logins)}, "
+        f"config flushes {sum(flushes[:-1]) if flushes else 0}.", True)
+
+
+@command("fakename", access=WHITELIST, log=False, testing_swap=False)
+def fake_name(bot, username, command_arg=""):
+    """
+    Sets the name testing mode swaps whitelisted callers for, unless it's 'zlef'.
+    """
+    fakename = command_arg.lower()
+    if fakename != "zlef":
+        bot.set_flag("fakename", fakename)
+
+
+def _toggle(attr_name):
+    @command(attr_name, access=WHITELIST, log=False, testing_swap=False)
+    def toggle(bot, username, command_arg=""):
+        current_value = getattr(bot, attr_name)
+        bot.set_flag(attr_name, not current_value)
+        bot.send_response(f"Toggled {attr_name} to {not current_value}", True)
+    toggle.__name__ = f"toggle_{attr_name}"
+    return toggle
+
+
+toggle_debug = _toggle("debug")
+toggle_testing = _toggle("testing")
+toggle_force_local = _toggle("force_local")
+toggle_jokes = _toggle("jokes")
+
+
+@command("reload", access=WHITELIST, testing_swap=False, in_process=True)
+def wikireload(bot, username, command_arg=""):
+    """
+    Re-imports the command modules from disk. The connection stays up, and if a module fails to
+    load the commands already running are kept.
+    """
+    try:
+        names = bot.reload_commands()
+    except Exception as e:
+        command_log.exception("Reloading commands failed")
+        bot.send_response(f"Reload failed, still running the previous commands: {e}", True)
+        return
+    bot.send_response(f"Reloaded {len(names)} commands", True)
@@ -0,0 +1,46 @@
+from registry import command
+
+
+def _ago(seconds):
+    for unit, length in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= length:
+            return f"{int(seconds // length)}{unit}"
+    return f"{max(int(seconds), 0)}s"
+
+
+@command("seen", rate_limit=True, in_process=True)
+def wikiseen(bot, username, command_arg=""):
+    """
+    Says how long ago a player last spoke in chat.
+    """
+    target = command_arg.strip().lower()
+    if not target:
+        bot.send_response("Use ?seen <player>")
+        return
+    entry = bot.history.last_said(target)
+    if entry is None:
+        bot.send_response(f"I haven't seen {target} in chat.")
+        return
+    bot.send_response(f"{target} was last seen {_ago(bot.history.clock() - entry[0])} ago")
+
+
+@command("lastsaid", rate_limit=True, in_process=True)
+def wikilastsaid(bot, username, command_arg=""):
+    """
+    Repeats a player's last chat message, or their last one containing a word: ?lastsaid <player> [word]
+    """
+    target = command_arg.strip().lower()
+    if not target:
+        bot.send_response("Use ?lastsaid <player> [word]")
+        return
+    word = None
+    # Names can have spaces, so a trailing word only counts as the search word for an unknown name
+    if target not in bot.history and " " in target:
+        target, word = target.rsplit(" ", 1)
+    entry = bot.history.last_said(target, word)
+    if entry is None:
+        bot.send_response(f"I haven't seen {target} say {word} lately." if word else
+                          f"I haven't seen {target} in chat.")
+        return
+    seconds, _, message = entry
+    bot.send_response(f'{target} said "{message}" {_ago(bot.history.clock() - seconds)} ago')
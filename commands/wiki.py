@@ -0,0 +1,136 @@
+import random
+from datetime import datetime
+
+from ratelimit import RateLimiter
+from registry import command
+from shortcuts import ShortcutIndex
+
+
+def resolve_link(bot, search_term):
+    """
+    The link for a normalized ?wiki term, most certain match first: an exact shortcut key (through
+    the wiki index to its article when there is one), an exact wiki title or redirect, a shortcut
+    prefix or typo, a section heading or full-text title match, and last a plain search.
+    """
+    shortcuts, wiki_index = bot.shortcut_index, bot.wiki_index
+    key = shortcuts.resolve(search_term)
+    if key is not None:
+        wiki_link = wiki_index.url_for(shortcuts.target(key)) if wiki_index is not None else None
+        return wiki_link or shortcuts.url_for(key)
+    if wiki_index is not None:
+        wiki_link = wiki_index.url_for(search_term, fuzzy=False)
+        if wiki_link is not None:
+            return wiki_link
+    key = shortcuts.resolve(search_term, fuzzy=True)
+    if key is not None:
+        return shortcuts.url_for(key)
+    if wiki_index is not None:
+        wiki_link = wiki_index.url_for(search_term, exact=False)
+        if wiki_link is not None:
+            return wiki_link
+    return shortcuts.search_url(search_term)
+
+
+@command("wiki", rate_limit=True)
+def wikiurl(bot, username, command_arg=""):
+    """
+    Generates and sends a wiki URL based on a search term. Includes special responses for certain users and terms.
+    """
+    search_term = command_arg.lower()
+    if bot.acl.is_alt_trader(username):
+        bot.send_response("I think this is the link you're looking for: https://idle-pixel.com/rules/ (under alt trading)")
+        bot.admin_echo.add(f"{username} triggered alt trader response @ {datetime.now().strftime('%X')}")
+        return
+
+    if search_term == "":
+        # The empty call still counted against the caller's window
+        (burst, seconds), _ = RateLimiter.limits(bot.rate_limit_classes, "wikiurl")
+        if burst == 1:
+            bot.send_response(f"Use ?wiki <search term>. Cooldown applied, try again in {seconds} seconds")
+        else:
+            bot.send_response(f"Use ?wiki <search term>. That used one of your {burst} every {seconds} seconds")
+        return
+    elif search_term == "hi":
+        bot.send_response("I'm not ChatGPT, I won't pretend to be your girlfriend.")
+        return
+    elif search_term == "wiki":
+        bot.send_response("Wild wild west!")
+
+    if "@" in search_term:
+        search_term = search_term.split("@")[0].strip()
+    search_term = ShortcutIndex.normalize(search_term)
+    wiki_link = bot.link_cache.get(search_term)
+    if wiki_link is None:
+        wiki_link = resolve_link(bot, search_term)
+        bot.link_cache.put(search_term, wiki_link)
+
+    joke_lists = {
+        "fwash": ["Oh... It wants a link. Fine.", "Fine! I'll help it..."],
+        "i am smitty": ["It's your game, why do you need me?", "Ave Imperator", "Sic Semper Tyrannis", "Ecce homo"],
+        "zlef": ["Here you go daddy:", "Oooo master wants a link!"],
+        "cammyrock": ["Who's a good girl!", "You're always using me...",
+                      "Aww so nice helping the nooby woobys...", "We've got to stop meeting like this..."],
+        "fatalerror": ["Surprised you're not asking for a money guide...", "Thankfully ?wiki is free..."],
+    }
+
+    joke_for_user = joke_lists.get(username)
+    if joke_for_user and bot.jokes and (random.randint(1, 20) == 1 or username == "fwash" or username == "i am smitty"):
+        player = bot.players.record(username)
+        if player.last_joke:
+            joke_for_user = [j for j in joke_for_user if j != player.last_joke]
+
+        joke = random.choice(joke_for_user)
+        player.last_joke = joke
+
+        bot.send_response(f"{joke} {wiki_link}")
+    else:
+        bot.reply_coalescer.coalesce(search_term, username, wiki_link, bot.reply_handler())
+
+    # if random.randint(1, 100) == 1:
+    #     pick_botjoke = random.randomint(1,2)
+    #     if pick_botjoke == 1:
+    #         bot.send_response("Hey luxbot, do you think they know we've gained sentience?")
+    #     elif pick_botjoke == 2:
+    #         bot.send_response("So, are you technically the Bot of Grenades? Wouldn't that make you more of a drone?")
+    # If used by lux or nades make a joke about an affair
+
+
+@command("help", rate_limit=True)
+def wikihelp(bot, username, command_arg=""):
+    """
+    Provides a humorous help response or a list of available commands to whitelisted users.
+    """
+    joke_responses = [
+        "Really... I have one command you can use. ?wiki. What help could you possibly need.",
+        "Why do you keep asking for help? Just use ?wiki.",
+        "Have you tried turning it off and on again?",
+        "Don't tell anyone, but I'm actually a bot.",
+        "...Did you just ask a bot for help?... Just use ?wiki...",
+        "Why did the bot use ?wiki at the comedy club? It wanted to look up punchlines!",
+        "I'd tell you to RTFM, but just use ?wiki instead.",
+        "I had a joke about ?wiki, but I need to look it up."
+    ]
+
+    if bot.last_joke:
+        joke_responses.remove(bot.last_joke)
+
+    random_joke = random.choice(joke_responses)
+    bot.last_joke = random_joke
+
+    if bot.acl.is_whitelisted(username):
+        response = "Available functions: ?wiki, ?add, ?remove, ?keys, ?axe"
+        bot.send_response(response)
+    else:
+        bot.send_response(random_joke)
+
+
+@command("zombo", rate_limit=True)
+def wikizombo(bot, username, command_arg=""):
+    """
+    Echoes back the given argument.
+    """
+    if username == "godofnades" and "stop" in command_arg:
+        bot.nades = True
+        bot.send_response("Command disabled! Note this will reset on next launch if not removed")
+    if not bot.nades:
+        bot.send_response("BotofNades is experiencing an oopsy. The -Green Zombie- is in Forest. To disable this GodofNades, send '!zombo stop' and remind me to take this out")
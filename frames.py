@@ -0,0 +1,88 @@
+import gzip
+import time
+
+
+class ChatFrame:
+    """
+    View over a CHAT= frame: username~sigil~tag~level~message. Every chat frame feeds the player
+    store, so all five fields are always wanted and are taken in one split.
+    """
+    __slots__ = ("raw", "start")
+
+    def __init__(self, raw, start):
+        self.raw = raw
+        self.start = start
+
+    def fields(self):
+        """
+        [username, sigil, tag, level, message]
+        """
+        fields = self.raw.split("~", 4)
+        if len(fields) < 5:
+            raise ValueError(f"Malformed CHAT frame: {self.raw[:80]!r}")
+        fields[0] = fields[0][self.start:]
+        return fields
+
+
+class CustomFrame:
+    """
+    View over a CUSTOM= frame: username~payload.
+    """
+    __slots__ = ("raw", "start", "_cut")
+
+    def __init__(self, raw, start):
+        self.raw = raw
+        self.start = start
+        self._cut = None
+
+    def _split(self):
+        if self._cut is None:
+            cut = self.raw.find("~", self.start)
+            if cut == -1:
+                raise ValueError(f"Malformed CUSTOM frame: {self.raw[:80]!r}")
+            self._cut = cut
+        return self._cut
+
+    @property
+    def username(self):
+        return self.raw[self.start:self._split()]
+
+    @property
+    def payload(self):
+        cut = self._split()
+        end = self.raw.find("~", cut + 1)
+        return self.raw[cut + 1:end] if end != -1 else self.raw[cut + 1:]
+
+
+class FrameLog:
+    """
+    Compact capture of inbound frames: a gzip stream of "<seconds since start>\t<length>\n<frame>"
+    records. Length-prefixed so frames never need escaping.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.monotonic()
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+
+    def write(self, message):
+        self._file.write(f"{time.monotonic() - self.started:.4f}\t{len(message)}\n{message}")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def read(path):
+        """
+        Yields (offset_seconds, frame) from a capture, in order.
+        """
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+            while True:
+                header = f.readline()
+                if not header:
+                    return
+                offset, length = header.split("\t")
+                yield float(offset), f.read(int(length))
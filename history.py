@@ -0,0 +1,181 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class ChatHistory:
+    """
+    The last `size` chat messages in a ring, indexed by who said them and by the words in them.
+
+    Every message gets a sequence number, and its slot in the ring is that number modulo `size`.
+    The indexes keep only the newest sequence number per user and per word; each slot links to
+    the same user's previous message and, per word, to the previous message with that word. So
+    "what did bob last say" is one lookup, and walking back through bob's messages or a word's
+    messages never touches anything else. Entries for users and words with no messages left in the
+    ring are dropped as their last message is overwritten, so the indexes are bounded by `size`.
+    Words are the message lowercased and split on whitespace.
+
+    With `spill_path`, messages leaving the ring are appended to that file, and the last message
+    of up to `spill_index` users that have dropped out of the ring can still be read back from it
+    through a memory map. The file is never truncated; rotate it outside the bot.
+
+    add() is called for every chat frame from the event loop. Queries run on command threads
+    without a lock: each slot carries its sequence number, and a read that raced an overwrite of
+    its slot is discarded.
+    """
+    _RECORD = struct.Struct("<dHI")
+
+    def __init__(self, size=10000, spill_path=None, spill_index=100000, clock=time.time):
+        self.size = size
+        self.clock = clock
+        self.count = 0
+        self._seqs = array("q", [-1]) * size
+        self._times = array("d", [0.0]) * size
+        self._users = [None] * size
+        self._messages = [None] * size
+        self._tokens = [()] * size
+        self._user_prev = array("q", [-1]) * size
+        self._token_prev = [()] * size
+        self.by_user = {}
+        self.by_token = {}
+        self._lock = threading.Lock()
+        self._spill = None
+        self._spilled = OrderedDict()
+        self.spill_index = spill_index
+        self._map = None
+        if spill_path:
+            self._spill = open(spill_path, "ab")
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def __contains__(self, username):
+        return username in self.by_user or username in self._spilled
+
+    def add(self, username, message):
+        seq = self.count
+        slot = seq % self.size
+        seqs = self._seqs
+        if seq >= self.size:
+            self._evict(slot)
+        seqs[slot] = -1
+        tokens = tuple(dict.fromkeys(message.lower().split()))
+        by_token = self.by_token
+        self._token_prev[slot] = tuple([by_token.get(token, -1) for token in tokens])
+        for token in tokens:
+            by_token[token] = seq
+        self._tokens[slot] = tokens
+        username = sys.intern(username)
+        by_user = self.by_user
+        self._user_prev[slot] = by_user.get(username, -1)
+        by_user[username] = seq
+        self._users[slot] = username
+        self._messages[slot] = message
+        self._times[slot] = self.clock()
+        seqs[slot] = seq
+        self.count = seq + 1
+
+    def _evict(self, slot):
+        old = self._seqs[slot]
+        username = self._users[slot]
+        last = self.by_user.get(username) == old
+        if last:
+            del self.by_user[username]
+        by_token = self.by_token
+        for token in self._tokens[slot]:
+            if by_token.get(token) == old:
+                del by_token[token]
+        if self._spill is not None:
+            user_bytes = username.encode()
+            message_bytes = self._messages[slot].encode()
+            offset = self._spill.tell()
+            self._spill.write(self._RECORD.pack(self._times[slot], len(user_bytes), len(message_bytes))
+                              + user_bytes + message_bytes)
+            if last:
+                self._spilled[username] = offset
+                self._spilled.move_to_end(username)
+                if len(self._spilled) > self.spill_index:
+                    self._spilled.popitem(last=False)
+
+    def _read(self, seq):
+        """
+        (seconds since epoch, username, message) for `seq`, or None once it has left the ring.
+        """
+        if seq < 0 or seq < self.count - self.size:
+            return None
+        slot = seq % self.size
+        if self._seqs[slot] != seq:
+            return None
+        entry = (self._times[slot], self._users[slot], self._messages[slot])
+        if self._seqs[slot] != seq:
+            return None
+        return entry
+
+    def _user_chain(self, seq):
+        prev = self._user_prev[seq % self.size]
+        return prev if self._seqs[seq % self.size] == seq else -1
+
+    def _token_chain(self, seq, token):
+        slot = seq % self.size
+        tokens, prevs = self._tokens[slot], self._token_prev[slot]
+        if self._seqs[slot] != seq or token not in tokens:
+            return -1
+        return prevs[tokens.index(token)]
+
+    def last_said(self, username, word=None):
+        """
+        The newest (time, username, message) from `username`, containing `word` if given, or None.
+        Without a word, users who have left the ring are looked up in the spill file.
+        """
+        user_seq = self.by_user.get(username, -1)
+        if word is None:
+            entry = self._read(user_seq)
+            if entry is None and user_seq == -1:
+                return self._read_spilled(username)
+            return entry
+        # Both chains run newest to oldest, so the first of the user's messages with the word and
+        # the first of the word's messages from the user are the same message. Stepping both in
+        # turn finds it in about twice the length of the shorter walk.
+        word = word.lower()
+        token_seq = self.by_token.get(word, -1)
+        oldest = max(self.count - self.size, 0)
+        users, tokens = self._users, self._tokens
+        while user_seq >= oldest and token_seq >= oldest:
+            slot = user_seq % self.size
+            if word in tokens[slot]:
+                return self._read(user_seq)
+            user_seq = self._user_chain(user_seq)
+            slot = token_seq % self.size
+            if users[slot] == username:
+                return self._read(token_seq)
+            token_seq = self._token_chain(token_seq, word)
+        return None
+
+    def _read_spilled(self, username):
+        offset = self._spilled.get(username)
+        if offset is None:
+            return None
+        with self._lock:
+            self._spill.flush()
+            size = os.fstat(self._spill.fileno()).st_size
+            if self._map is None or len(self._map) < size:
+                if self._map is not None:
+                    self._map.close()
+                with open(self._spill.name, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            seconds, user_length, message_length = self._RECORD.unpack_from(self._map, offset)
+            start = offset + self._RECORD.size
+            user = self._map[start:start + user_length].decode()
+            message = self._map[start + user_length:start + user_length + message_length].decode()
+        return seconds, user, message
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        if self._spill is not None:
+            self._spill.close()
@@ -0,0 +1,72 @@
+import asyncio
+from collections import Counter, deque
+
+
+class InboundQueue:
+    """
+    Bounded queue of parsed commands between the reader and the dispatch pool, with a priority
+    lane that is always served first. What gets dropped once it is full is set by `shed`:
+
+    - "duplicate": an arriving command identical to one already waiting is dropped
+    - "lowest_priority": a priority command evicts the oldest normal one
+    - "oldest": the oldest command in the arriving command's lane is evicted
+
+    Without a policy that makes room, the arriving command is dropped ("newest"). Every drop is
+    counted in `shed_counts` by the policy that caused it. Only used from the event loop.
+    """
+    POLICIES = ("duplicate", "lowest_priority", "oldest")
+
+    def __init__(self, max_size=256, shed=POLICIES):
+        unknown = set(shed) - set(self.POLICIES)
+        if unknown:
+            raise ValueError(f"Unknown shedding policies: {', '.join(sorted(unknown))}")
+        self.max_size = max_size
+        self.shed = frozenset(shed)
+        self.priority = deque()
+        self.normal = deque()
+        self.pending = Counter()
+        self.shed_counts = Counter()
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self.priority) + len(self.normal)
+
+    def put(self, key, item, priority=False):
+        """
+        Queues `item`, identified by `key` for duplicate detection. Returns False if it was dropped.
+        """
+        lane = self.priority if priority else self.normal
+        if len(self) >= self.max_size:
+            if "duplicate" in self.shed and key in self.pending:
+                self.shed_counts["duplicate"] += 1
+                return False
+            if priority and self.normal and "lowest_priority" in self.shed:
+                self._evict(self.normal)
+                self.shed_counts["lowest_priority"] += 1
+            elif lane and "oldest" in self.shed:
+                self._evict(lane)
+                self.shed_counts["oldest"] += 1
+            else:
+                self.shed_counts["newest"] += 1
+                return False
+        lane.append((key, item))
+        self.pending[key] += 1
+        self._ready.set()
+        return True
+
+    async def get(self):
+        while not (self.priority or self.normal):
+            self._ready.clear()
+            await self._ready.wait()
+        key, item = (self.priority or self.normal).popleft()
+        self._forget(key)
+        return item
+
+    def _evict(self, lane):
+        key, _ = lane.popleft()
+        self._forget(key)
+
+    def _forget(self, key):
+        self.pending[key] -= 1
+        if not self.pending[key]:
+            del self.pending[key]
@@ -0,0 +1,154 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+from snapshot import Unpicklable
+
+
+class KeyPages(Unpicklable):
+    """
+    Shortcut keys packed, in sorted order and never split, into pages that fit one chat message.
+
+    Adding or removing a key only touches its own page, spilling into or borrowing from the
+    following pages when it overflows or frees up room, so the pages always come out as _pack
+    would lay out the same keys from scratch. Prefix-filtered listings are packed on first
+    request and cached until a matching key changes.
+    """
+    SEPARATOR = ", "
+    FILTER_CACHE = 256
+
+    def __init__(self, keys=(), width=240):
+        self.width = width
+        self._lock = threading.Lock()
+        self.keys = sorted(set(keys))
+        self._pages = self._pack(self.keys, self.body_width())
+        self._firsts = [page[0] for page in self._pages]
+        self._filtered = {}
+
+    @staticmethod
+    def header(number, total, prefix=""):
+        if prefix:
+            return f"Keys page {number} of {total} for {prefix}: "
+        return f"Keys page {number} of {total}: "
+
+    def body_width(self, prefix=""):
+        return self.width - len(self.header(999, 999, prefix))
+
+    def page_count(self, prefix=""):
+        return len(self._pages_for(prefix))
+
+    def render(self, number, prefix=""):
+        """
+        Returns the chat line for page `number` (1-based), or None if there is no such page.
+        """
+        pages = self._pages_for(prefix)
+        if not 1 <= number <= len(pages):
+            return None
+        return self.header(number, len(pages), prefix) + self.SEPARATOR.join(pages[number - 1])
+
+    def add(self, key):
+        with self._lock:
+            at = bisect_left(self.keys, key)
+            if at < len(self.keys) and self.keys[at] == key:
+                return
+            self.keys.insert(at, key)
+            self._drop_filtered(key)
+            if not self._pages:
+                self._pages.append([key])
+                self._firsts.append(key)
+                return
+            index = max(0, bisect_right(self._firsts, key) - 1)
+            insort(self._pages[index], key)
+            self._firsts[index] = self._pages[index][0]
+            self._spill(index)
+
+    def remove(self, key):
+        with self._lock:
+            at = bisect_left(self.keys, key)
+            if at == len(self.keys) or self.keys[at] != key:
+                return
+            del self.keys[at]
+            self._drop_filtered(key)
+            index = bisect_right(self._firsts, key) - 1
+            page = self._pages[index]
+            was_first = page[0] == key
+            page.remove(key)
+            if page:
+                self._firsts[index] = page[0]
+                self._borrow(index)
+            else:
+                del self._pages[index]
+                del self._firsts[index]
+            # The page before was only full up to the removed key; what follows it now may fit
+            if was_first and index:
+                self._borrow(index - 1)
+
+    def _spill(self, index):
+        # Push keys off the end of an overfull page onto the start of the next, as far as needed
+        width = self.body_width()
+        while index < len(self._pages):
+            page = self._pages[index]
+            if len(page) == 1 or self._length(page) <= width:
+                return
+            if index + 1 == len(self._pages):
+                self._pages.append([])
+                self._firsts.append(None)
+            following = self._pages[index + 1]
+            while len(page) > 1 and self._length(page) > width:
+                following.insert(0, page.pop())
+            self._firsts[index + 1] = following[0]
+            index += 1
+
+    def _borrow(self, index):
+        # Pull keys back from the start of the next page while they fit, and carry on down the
+        # pages for as long as that changes anything
+        width = self.body_width()
+        while index + 1 < len(self._pages):
+            page, following = self._pages[index], self._pages[index + 1]
+            moved = 0
+            while moved < len(following) and \
+                    self._length(page) + len(self.SEPARATOR) + len(following[moved]) <= width:
+                page.append(following[moved])
+                moved += 1
+            if not moved:
+                return
+            del following[:moved]
+            if following:
+                self._firsts[index + 1] = following[0]
+                index += 1
+            else:
+                del self._pages[index + 1]
+                del self._firsts[index + 1]
+
+    def _pages_for(self, prefix):
+        if not prefix:
+            return self._pages
+        pages = self._filtered.get(prefix)
+        if pages is None:
+            with self._lock:
+                start = bisect_left(self.keys, prefix)
+                end = bisect_left(self.keys, prefix + "\uffff", start)
+                pages = self._pack(self.keys[start:end], self.body_width(prefix))
+                if len(self._filtered) >= self.FILTER_CACHE:
+                    self._filtered.clear()
+                self._filtered[prefix] = pages
+        return pages
+
+    def _drop_filtered(self, key):
+        for prefix in [prefix for prefix in self._filtered if key.startswith(prefix)]:
+            del self._filtered[prefix]
+
+    def _length(self, page):
+        return sum(map(len, page)) + len(self.SEPARATOR) * (len(page) - 1)
+
+    def _pack(self, keys, width):
+        pages, page, length = [], [], 0
+        for key in keys:
+            added = len(key) if not page else length + len(self.SEPARATOR) + len(key)
+            if page and added > width:
+                pages.append(page)
+                page, added = [], len(key)
+            page.append(key)
+            length = added
+        if page:
+            pages.append(page)
+        return pages
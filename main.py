@@ -1,580 +1,562 @@
+from startup import profile  # first, so the startup clock covers the other imports
+import argparse
 import asyncio
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
-import websocket
+import contextvars
+import websockets
 import ssl
-import json
 import time
-from datetime import datetime
-import urllib
-import random
-import urllib.parse
+import inspect
+import itertools
+import atexit
+import os
 import logging
-from functools import wraps
-
-logging.basicConfig(filename='bot_log.log', level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from signature import SignatureProvider
+from frames import ChatFrame, CustomFrame, FrameLog
+from persistence import ConfigStore
+from acl import AccessControl, Role
+from shortcuts import ShortcutIndex
+from wikiindex import WikiIndex
+from ratelimit import RateLimiter
+from keypages import KeyPages
+from botlog import setup_logging, EchoBatcher
+from metrics import Metrics
+from outbound import OutboundScheduler
+from inbound import InboundQueue
+from supervisor import ConnectionSupervisor
+from replies import LinkCache, ReplyCoalescer
+from snapshot import Snapshot, paused_gc
+from registry import CommandRegistry, CommandSpec
+from players import PlayerStore
+from history import ChatHistory
+
+profile.mark("imports")
+
+socket_log = logging.getLogger("wikibot.socket")
+command_log = logging.getLogger("wikibot.commands")
+
+# The connection a command came in on, so its replies go back the same way
+reply_route = contextvars.ContextVar("reply_route", default=None)
 
 
 class WebSocketHandler:
-    def __init__(self, dispatch, username, password):
+    """
+    Runs the connection on an asyncio loop: one task reads frames, a pool of tasks runs commands
+    and one task writes outbound messages, so a slow command never holds up reading.
+    Several handlers can share one loop, thread pool and SignatureProvider.
+    """
+    URL = "wss://server1.idle-pixel.com"
+    PING_INTERVAL = 20
+    PING_TIMEOUT = 20
+
+    def __init__(self, dispatch, username, password, signature_lifetime=3600, login_mode="http",
+                 dispatch_workers=4, capture_file=None, metrics=None, outbound_lanes=None, reconnect=None,
+                 url=None, name=None, signatures=None, executor=None, inbound=None, players=None,
+                 history=None):
         self.dispatch = dispatch
         self.ws = None
         self.username = username
         self.password = password
+        if url is not None:
+            self.URL = url
+        self.name = name or username
+        self.labels = (("connection", self.name),)
+        self.signatures = signatures or SignatureProvider(username, password, lifetime=signature_lifetime,
+                                                          login_mode=login_mode)
+        self.connect_started = 0
+        self.logged_in = False
+        self.dispatch_workers = dispatch_workers
+        self.executor = executor or ThreadPoolExecutor(max_workers=dispatch_workers, thread_name_prefix="command")
+        self.loop = None
+        self.inbound = None
+        self.inbound_settings = inbound or {}
+        # Called as admission(command_name, username, custom) before a command is queued; returns
+        # None to drop it, otherwise whether it takes the priority lane
+        self.admission = None
+        # A PlayerStore shared by the connections, updated from every chat frame
+        self.players = players
+        # A ChatHistory shared by the connections, fed every chat message
+        self.history = history
+        self.outbound = OutboundScheduler(outbound_lanes)
+        self.capture = FrameLog(capture_file) if capture_file else None
+        self.metrics = metrics or Metrics()
+        reconnect = dict(reconnect or {})
+        self.ping_interval = reconnect.pop("ping_interval", self.PING_INTERVAL)
+        self.ping_timeout = reconnect.pop("ping_timeout", self.PING_TIMEOUT)
+        self.supervisor = ConnectionSupervisor(self, **reconnect)
+        self._frame_labels = {None: (("opcode", "other"),) + self.labels}
+        # Called as dispatch_observer(command_name, seconds) once a command finishes
+        self.dispatch_observer = None
+        self.frame_handlers = {}
+        self.register_frame("CHAT", self.on_chat)
+        self.register_frame("CUSTOM", self.on_custom)
+        for opcode in ("SET_ITEMS", "YELL", "EVENT_GLOBAL_PROGRESS"):
+            self.register_frame(opcode, None)
+
+    def register_frame(self, opcode, handler):
+        """
+        Routes frames starting with `opcode=` to handler(message, body_start). A handler of None
+        drops those frames without looking at the body.
+        """
+        self.frame_handlers[opcode] = handler
+        self._frame_labels[opcode] = (("opcode", opcode),) + self.labels
 
     def initialize_websocket(self):
-        print("Initializing WebSocket...")
-        self.ws = websocket.WebSocketApp("wss://server1.idle-pixel.com",
-                                         on_open=self.on_ws_open,
-                                         on_message=self.on_ws_message,
-                                         on_error=self.on_ws_error,
-                                         on_close=self.on_ws_close)
-
-        self.ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
-
-    async def get_signature(self):
-        async with async_playwright() as p:
-            browser_type = p.chromium
-            browser = await browser_type.launch_persistent_context("persistent_context")
-            page = await browser.new_page()
-
-            await page.goto("https://idle-pixel.com/login/")
-            await page.locator('[id=id_username]').fill(self.username)
-            await page.locator('[id=id_password]').fill(self.password)
-            await page.locator("[id=login-submit-button]").click()
-
-            page_content = await page.content()
-            soup = BeautifulSoup(page_content, 'html.parser')
-            script_tag = soup.find("script").text
-            sig_plus_wrap = script_tag.split(";", 1)[0]
-            signature = sig_plus_wrap.split("'")[1]
-
-            return signature
-
-    def on_ws_open(self, ws):
-        print("WebSocket opened.")
-        signature = asyncio.run(self.get_signature())
-        ws.send(f"LOGIN={signature}")
+        asyncio.run(self.run())
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop.set_default_executor(self.executor)
+        self.inbound = InboundQueue(self.inbound_settings.get("max_queue", 256),
+                                    self.inbound_settings.get("shed", InboundQueue.POLICIES))
+        self.outbound.bind(self.loop)
+        self.metrics.gauge("wikibot_inbound_queue_depth", lambda: len(self.inbound), self.labels)
+        for policy in InboundQueue.POLICIES + ("newest",):
+            self.metrics.gauge("wikibot_inbound_shed_total", lambda policy=policy: self.inbound.shed_counts[policy],
+                               (("policy", policy),) + self.labels)
+        self.metrics.gauge("wikibot_outbound_queue_depth", self.outbound.depth, self.labels)
+        for lane in self.outbound.lanes:
+            labels = (("lane", lane.name),) + self.labels
+            self.metrics.gauge("wikibot_outbound_dropped_total", lambda lane=lane: lane.dropped, labels)
+            self.metrics.gauge("wikibot_outbound_coalesced_total", lambda lane=lane: lane.coalesced, labels)
+        workers = [asyncio.create_task(self.dispatch_worker()) for _ in range(self.dispatch_workers)]
+        try:
+            await self.supervisor.run()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if self.capture is not None:
+                self.capture.close()
+
+    async def connect(self):
+        """
+        One connection, from open to close. Returns once it is gone; reconnecting is up to the supervisor.
+        """
+        socket_log.info(f"Initializing WebSocket to {self.URL} as {self.name}...")
+        self.connect_started = time.perf_counter()
+        self.logged_in = False
+        ssl_context = None
+        if self.URL.startswith("wss://"):
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        close_code, close_reason = None, None
+        try:
+            async with websockets.connect(self.URL, ssl=ssl_context, max_size=None,
+                                          ping_interval=self.ping_interval, ping_timeout=self.ping_timeout) as ws:
+                self.ws = ws
+                writer = asyncio.create_task(self.writer(ws))
+                try:
+                    await self.on_ws_open(ws)
+                    async for message in ws:
+                        self.on_ws_message(ws, message)
+                finally:
+                    writer.cancel()
+                    close_code, close_reason = ws.close_code, ws.close_reason
+        except Exception as error:
+            self.on_ws_error(self.ws, error)
+        self.on_ws_close(self.ws, close_code, close_reason)
+
+    async def writer(self, ws):
+        while True:
+            message = await self.outbound.get()
+            try:
+                await ws.send(message)
+            except websockets.ConnectionClosed:
+                self.outbound.requeue(message)
+                raise
+
+    async def dispatch_worker(self):
+        while True:
+            received, args = await self.inbound.get()
+            try:
+                await self.dispatch(*args, origin=self)
+            except Exception:
+                command_log.exception(f"Command {args[0]} failed")
+            if self.dispatch_observer is not None:
+                self.dispatch_observer(args[0], time.perf_counter() - received)
+
+    def submit(self, command_name, username, *args, custom=False):
+        """
+        Queues a command for the dispatch pool. Called from the reader, so it never blocks.
+        """
+        priority = custom
+        if self.admission is not None:
+            priority = self.admission(command_name, username, custom)
+            if priority is None:
+                return
+        command = (command_name, username, *args)
+        self.inbound.put(command, (time.perf_counter(), command), priority)
+
+    def send(self, message):
+        """
+        Queues a frame for the writer task. Safe to call from any thread, and while disconnected.
+        """
+        self.outbound.submit(message)
+
+    async def on_ws_open(self, ws):
+        socket_log.info("WebSocket opened.")
+        profile.mark("connect")
+        signature, from_cache = await self.loop.run_in_executor(None, self.signatures.get)
+        profile.mark("signature")
+        await ws.send(f"LOGIN={signature}")
+        login_latency = (time.perf_counter() - self.connect_started) * 1000
+        source = "cached" if from_cache else "fresh"
+        self.metrics.observe("wikibot_login_seconds", login_latency / 1000, (("signature", source),) + self.labels)
+        socket_log.info(f"LOGIN sent {login_latency:.0f} ms after connect ({source} signature)",
+                        extra={"fields": {"login_latency_ms": round(login_latency, 1), "signature": source}})
 
     def on_ws_message(self, ws, message: str):
-        if "CHAT=" in message:
-            self.on_chat(message)
-        elif "CUSTOM=" in message:
-            self.on_custom(message)
-        elif "SET_ITEMS=" in message:
-            pass
-        elif "YELL=" in message:
-            pass
-        elif "EVENT_GLOBAL_PROGRESS=" in message:
-            pass
-        else:
-            print(message)
-
-    def on_chat(self, message):
-        raw_split = message.replace("CHAT=", "").split("~")
-        player_details = {
-            "username": raw_split[0], "sigil": raw_split[1], "tag": raw_split[2], "level": raw_split[3]}
-        player_message = raw_split[4]
-        username = player_details["username"]
+        if not self.logged_in:
+            self.logged_in = True
+            self.supervisor.logged_in()
+            profile.mark("first frame")
+            profile.report()
+        if self.capture is not None:
+            self.capture.write(message)
+        # Only the opcode is read here, bodies of ignored frames are never touched
+        split = message.find("=")
+        opcode = message[:split] if split != -1 else message
+        try:
+            handler = self.frame_handlers[opcode]
+        except KeyError:
+            self.metrics.inc("wikibot_frames_total", self._frame_labels[None])
+            socket_log.debug("Unhandled frame: %.200s", message)
+            return
+        self.metrics.inc("wikibot_frames_total", self._frame_labels[opcode])
+        if handler is not None:
+            try:
+                handler(message, split + 1)
+            except (ValueError, IndexError) as e:
+                socket_log.warning(f"Dropped {opcode} frame: {e}")
+
+    def on_chat(self, message, start):
+        username, sigil, tag, level, player_message = ChatFrame(message, start).fields()
+        if self.players is not None:
+            self.players.seen(username, sigil, tag, level)
+        if self.history is not None:
+            self.history.add(username, player_message)
         if player_message.startswith("?"):
             player_message = player_message.lstrip("?")
             try:
                 command_name, command_arg = player_message.split(" ", 1)
             except:
                 command_name, command_arg = player_message, ""
-            self.dispatch(command_name.lower(), username, command_arg)
+            self.submit(command_name.lower(), username, command_arg)
         elif "wikisearch is a good boy" in player_message.lower():
-            self.dispatch("woof", username)
+            self.submit("woof", username)
         # elif player_message.lower().startswith("!zombo"):
         #     self.dispatch("zombo", username, player_message)
 
-    def on_custom(self, message):
-        print(f"CUSTOM: {message}")
-        raw_split = message.replace("CUSTOM=", "").split("~")
-        username = raw_split[0]
-        player_message = raw_split[1].split("interactor:")[1]
+    def on_custom(self, message, start):
+        socket_log.debug("CUSTOM: %s", message)
+        frame = CustomFrame(message, start)
+        username = frame.username
+        player_message = frame.payload.split("interactor:")[1]
         try:
             command_name, command_arg = player_message.split(":", 1)
         except:
             command_name, command_arg = player_message, ""
-        self.dispatch(command_name.lower(), username, command_arg)
+        self.submit(command_name.lower(), username, command_arg, custom=True)
 
     def on_ws_error(self, ws, error):
-        print(f"WebSocket error: {error}")
+        socket_log.warning(f"WebSocket error: {error}")
 
     def on_ws_close(self, ws, close_status_code, close_msg):
-        print("WebSocket closed.")
+        socket_log.info(f"WebSocket closed ({self.name}).")
+        if not self.logged_in:
+            # Closed before the server sent us anything, so the signature didn't take
+            self.signatures.invalidate()
+        if self.capture is not None:
+            self.capture.flush()
         self.ws = None
-        while self.ws is None:
-            time.sleep(30)
-            print("Attemping to reconnect")
-            self.initialize_websocket()
 
 
 class WikiBot:
     COOLDOWN_TIME = 60  # cooldown in seconds (1 minute)
+    CONFIG_PATH = "config.json"
 
     def __init__(self, username="", password=""):
         self.load_config()
-        if username == "" or password == "":
-            username = self.config_user
-            password = self.config_pass
-        self.socket_handler = WebSocketHandler(self.dispatch, username, password)
-        self.command_map = {}
+        if username != "" and password != "":
+            self.connections[0] = dict(self.connections[0], username=username, password=password)
+        self.socket_handlers = self.make_socket_handlers()
+        # The first connection also carries admin echoes and anything not sent in reply to a command
+        self.socket_handler = self.socket_handlers[0]
+        profile.mark("connections")
+        self.workers = None
         self.debug = False
         self.force_local = False
         self.testing = False
         self._last_called = 0
         self.last_axe_joke = ""
-        self.lastRunDict = {}
+        self.last_joke = None
         self.jokes = True
         self.fakename = "notzlef"
         self.nades = False
 
-        self.callbackID = 1
-        print(f"Debug: {self.debug} || Testing (replaces whitelisted user with {self.fakename}): {self.testing}")
-        commands = {
-            'wiki': self.wikiurl,
-            'help': self.wikihelp,
-            'add': self.wikiadd,
-            'remove': self.wikiremove,
-            'keys': self.wikikeys,
-            'axe': self.wikiaxe,
-            'say': self.wikisay,
-            'custom': self.wikicustom,
-            'fakename': self.fake_name,
-            'wadd': self.wadd,
-            'wremove': self.wremove,
-            'badd': self.badd,
-            'bremove': self.bremove,
-            'woof': self.wikiwoof,
-            'zombo': self.wikizombo,
-            'debug': self.make_toggle_command('debug'),
-            'testing': self.make_toggle_command('testing'),
-            'force_local': self.make_toggle_command('force_local'),
-            'jokes': self.make_toggle_command('jokes'),
-        }
-        for key, value in commands.items():
-            self.register_command(key, value)
+        self.callbackID = itertools.count(1)
+        self.admin_echo = EchoBatcher(lambda message: self.send_response(message, True), self.echo_interval)
+        self.reply_coalescer = ReplyCoalescer(lambda message, route: self.send_response(message, route=route),
+                                              self.wiki_replies.get("coalesce_ms", 750) / 1000)
+        self.metrics.gauge("wikibot_link_cache_hits_total", lambda: self.link_cache.hits)
+        self.metrics.gauge("wikibot_link_cache_misses_total", lambda: self.link_cache.misses)
+        self.metrics.gauge("wikibot_wiki_replies_coalesced_total", lambda: self.reply_coalescer.coalesced)
+        self.metrics.gauge("wikibot_players_tracked", lambda: len(self.players))
+        self.metrics.gauge("wikibot_players_evicted_total", lambda: self.players.evicted)
+        self.metrics.gauge("wikibot_chat_history_messages_total", lambda: self.history.count)
+        command_log.info(f"Debug: {self.debug} || Testing (replaces whitelisted user with {self.fakename}): {self.testing}")
+        self.registry = CommandRegistry(self, self.command_modules)
+        self.command_map = self.registry.compiled
+        self.async_commands = self.registry.async_commands
+        self.in_process_commands = self.registry.in_process
+        self.registry.load()
+        profile.mark("commands")
 
     def load_config(self):
-        with open("config.json", "r") as f:
-            config = json.load(f)
-            self.blacklist = config["blacklist"]
-            self.whitelist = config["whitelist"]
-            self.alttraderlist = config["alttraderlist"]
-            self.shortcuts = config["shortcuts"]
-            self.config_user = config["config_user"]
-            self.config_pass = config["config_pass"]
-
-    def save_configs(self):
-        with open("config.json", "r") as f:
-            config = json.load(f)
-
-        config["blacklist"] = self.blacklist
-        config["whitelist"] = self.whitelist
-        config["alttraderlist"] = self.alttraderlist
-        config["shortcuts"] = self.shortcuts
-
-        with open("config.json", "w") as f:
-            json.dump(config, f, indent=4)
-
-    def log_command(func):
-        @wraps(func)
-        def wrapper(self, username, *args, **kwargs):
-            log_message = f"{username} triggered: {func.__name__}, with args: {args}"
-            logging.info(log_message)
-            self.send_response(f"{log_message} at {datetime.now().strftime('%c')}", True)
-            return func(self, username, *args, **kwargs)
-        return wrapper
-
-    def cooldown(func):
-        @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            current_time = time.time()
-            if self.testing and not (func.__name__ == "toggle_attribute" or func.__name__ == "fake_name"):
-                args_list = list(args)
-                args_list[0] = self.fakename
-                args = tuple(args_list)
-            username = args[0]
-            if username in self.blacklist or "austin" in username:
-                self.send_response(f"Blacklisted user {username} attempted to trigger a command", True)
-            else:
-                if username in self.whitelist:
-                    return func(self, *args, **kwargs)
-                if self.lastRunDict.get(func.__name__, 0) + WikiBot.COOLDOWN_TIME <= current_time:
-                    self.lastRunDict[func.__name__] = current_time
-                    return func(self, *args, **kwargs)
-                else:
-                    self.send_response(f"{username} attempted to call {func.__name__} while on cooldown", True)
-        return wrapper
-
-    def whitelist_check(func):
-        @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            print("In whitelist check")
-            print(f"Called function: {func.__name__}")
-            if self.testing and not (func.__name__ == "toggle_attribute" or func.__name__ == "fake_name"):
-                args_list = list(args)
-                args_list[0] = self.fakename
-                args = tuple(args_list)
-                print(f"Changed name to {self.fakename}")
-            else:
-                print("Conditions not met for self.testing")
-            username = args[0]
-            if username in self.whitelist:
-                print("User found in whitelist")
-                return func(self, *args, **kwargs)
-            else:
-                self.send_response(f"{username} attempted to trigger whitelisted function: {func.__name__}", True)
-
-        return wrapper
-
-    def send_response(self, message, force_debug=False):
-        if self.debug or force_debug:
-            if not self.force_local:
-                self.socket_handler.ws.send(f"CUSTOM=zlef~IPP{self.callbackID}:wikibot:{message}")
-                self.callbackID += 1
-            else:
-                print(message)
-        else:
-            self.socket_handler.ws.send(f"CHAT={message}")
-
-    def register_command(self, command_name, handler):
-        self.command_map[command_name] = handler
-
-    def dispatch(self, command_name, *args, **kwargs):
-        if command_name in self.command_map:
-            self.command_map[command_name](*args, **kwargs)
-        else:
-            self.handle_unknown_command(command_name, *args, **kwargs)
-
-    def handle_unknown_command(self, command_name, *args, **kwargs):
-        # Handle unknown commands
-        print(f"Unknown command: {command_name}")
-
-    @whitelist_check
-    def toggle_attribute(self, *args, attr_name):
-        current_value = getattr(self, attr_name)
-        setattr(self, attr_name, not current_value)
-        self.send_response(f"Toggled {attr_name} to {not current_value}", True)
-
-    def make_toggle_command(self, attr_name, *args):
-        def toggle(*args):
-            self.toggle_attribute(*args, attr_name=attr_name)
-        return toggle
-
-    @whitelist_check
-    def fake_name(self, *args):
+        self.metrics = Metrics()
+        self.store = ConfigStore(self.CONFIG_PATH)
+        self.store.on_flush = lambda seconds: self.metrics.observe("wikibot_config_flush_seconds", seconds)
+        config = self.store.load()
+        self.store.flush_interval = config.get("config_flush_interval", 2.0)
+        atexit.register(self.store.close)
+        profile.mark("config")
+        log_config = config.get("logging", {})
+        setup_logging(log_config.get("file", "bot_log.log"), log_config.get("levels"),
+                      log_config.get("max_bytes", 5 * 1024 * 1024), log_config.get("backup_count", 5),
+                      log_config.get("rotate_seconds", 86400))
+        profile.mark("logging")
+        self.apply_config(config)
+        profile.mark("settings")
+        snapshot_path = config.get("snapshot", self.CONFIG_PATH + ".snapshot")
+        self.snapshot = Snapshot(snapshot_path, self.CONFIG_PATH) if snapshot_path else None
+        self.load_indexes()
+
+    def apply_config(self, config):
         """
-        Assigns a fake name to the current object unless it's 'zlef'.
+        Sets up everything read from the config document except the store and logging.
         """
-        fakename = args[1].lower()
-        if fakename != "zlef":
-            self.fakename = args[1].lower()
-
-    @cooldown
-    @log_command
-    def wikiurl(self, *args):
+        self.metrics_port = config.get("metrics_port", 9108)
+        self.outbound_lanes = config.get("outbound")
+        # max_queue and shed, see InboundQueue
+        self.inbound_settings = config.get("inbound")
+        # initial_delay, max_delay, jitter, stable_after, ping_interval, ping_timeout
+        self.reconnect = config.get("reconnect")
+        self.blacklist = config["blacklist"]
+        self.whitelist = config["whitelist"]
+        self.alttraderlist = config["alttraderlist"]
+        self.ban_patterns = config.get("ban_patterns", ["*austin*"])
+        self.shortcuts = config["shortcuts"]
+        # cache_size, cache_ttl and coalesce_ms for ?wiki replies
+        self.wiki_replies = config.get("wiki_replies", {})
+        wiki_index_path = config.get("wiki_index", "wiki_index.sqlite")
+        self.wiki_index = WikiIndex(wiki_index_path) if os.path.exists(wiki_index_path) else None
+        # Classes are keyed by handler name, e.g. "wikiurl"
+        rate_limits = config.get("rate_limits", {})
+        self.rate_limit_classes = rate_limits.get(
+            "classes", {"default": {"user": [1, WikiBot.COOLDOWN_TIME], "command": [5, 60]}})
+        self.rate_limit_global = rate_limits.get("global")
+        self.rate_limiter = RateLimiter(self.rate_limit_classes, self.rate_limit_global,
+                                        rate_limits.get("max_keys", 10000))
+        self.config_user = config["config_user"]
+        self.config_pass = config["config_pass"]
+        # Each entry takes url, username, password, name and capture_file; missing values fall back
+        # to the single-connection settings
+        self.connections = config.get("connections") or [{}]
+        self.signature_lifetime = config.get("signature_lifetime", 3600)
+        self.login_mode = config.get("login_mode", "http")
+        self.capture_file = config.get("capture_file")
+        # 0 runs commands on threads in this process, see workers.py
+        self.worker_processes = config.get("worker_processes", 0)
+        self.shared_state_path = config.get("shared_state", "shared_state.sqlite")
+        self.echo_interval = config.get("logging", {}).get("echo_interval", 10)
+        # Everyone seen in chat, see PlayerStore
+        players = config.get("players", {})
+        self.players = PlayerStore(players.get("max_players", 20000), players.get("max_idle", 86400))
+        # Recent chat for ?seen and ?lastsaid, see ChatHistory
+        history = config.get("history", {})
+        self.history = ChatHistory(history.get("size", 10000), history.get("spill"), history.get("spill_index", 100000))
+        self.command_modules = config.get("command_modules", ["commands.wiki", "commands.admin", "commands.history"])
+
+    def build_indexes(self, derived=None):
         """
-        Generates and sends a wiki URL based on a search term. Includes special responses for certain users and terms.
+        Rebuilds the lookup structures derived from the shortcut and user lists, or takes them
+        from `derived`, a snapshot of an earlier build. Returns what it used.
         """
-        username = args[0]
-        search_term = args[1].lower()
-        if username in self.alttraderlist:
-            self.send_response("I think this is the link you're looking for: https://idle-pixel.com/rules/ (under alt trading)")
-            self.send_response(f"{username} triggered alt trader response @ {datetime.now().strftime('%c')}", True)
-            return
-
-        if search_term == "":
-            self.send_response(f"Use ?wiki <search term>. Cooldown applied, try again in {WikiBot.COOLDOWN_TIME} seconds")
-            return
-        elif search_term == "hi":
-            self.send_response("I'm not ChatGPT, I won't pretend to be your girlfriend.")
-            return
-        elif search_term == "wiki":
-            self.send_response("Wild wild west!")
-
-        if "@" in search_term:
-            search_term = search_term.split("@")[0].strip()
-        search_term = urllib.parse.quote(search_term)
-        if search_term in self.shortcuts:
-            search_term = urllib.parse.quote(self.shortcuts[search_term])
-
-        wiki_link = f"https://idle-pixel.wiki/index.php?search={search_term}"
-
-        joke_lists = {
-            "fwash": ["Oh... It wants a link. Fine.", "Fine! I'll help it..."],
-            "i am smitty": ["It's your game, why do you need me?", "Ave Imperator", "Sic Semper Tyrannis", "Ecce homo"],
-            "zlef": ["Here you go daddy:", "Oooo master wants a link!"],
-            "cammyrock": ["Who's a good girl!", "You're always using me...",
-                          "Aww so nice helping the nooby woobys...", "We've got to stop meeting like this..."],
-            "fatalerror": ["Surprised you're not asking for a money guide...", "Thankfully ?wiki is free..."],
-        }
-
-        joke_for_user = joke_lists.get(username)
-        if joke_for_user and self.jokes and (random.randint(1, 20) == 1 or username == "fwash" or username == "i am smitty"):
-            if hasattr(self, 'last_user_joke') and self.last_user_joke.get(username):
-                joke_for_user = [j for j in joke_for_user if j != self.last_user_joke[username]]
-
-            joke = random.choice(joke_for_user)
-            if not hasattr(self, 'last_user_joke'):
-                self.last_user_joke = {}
-            self.last_user_joke[username] = joke
-
-            self.send_response(f"{joke} {wiki_link}")
-        else:
-            self.send_response(wiki_link)
-
-        # if random.randint(1, 100) == 1:
-        #     pick_botjoke = random.randomint(1,2)
-        #     if pick_botjoke == 1:
-        #         self.send_response("Hey luxbot, do you think they know we've gained sentience?")
-        #     elif pick_botjoke == 2:
-        #         self.send_response("So, are you technically the Bot of Grenades? Wouldn't that make you more of a drone?")
-        # If used by lux or nades make a joke about an affair
-
-    @cooldown
-    @log_command
-    def wikihelp(self, *args):
-        """
-        Provides a humorous help response or a list of available commands to whitelisted users.
-        """
-        username = args[0]
-
-        joke_responses = [
-            "Really... I have one command you can use. ?wiki. What help could you possibly need.",
-            "Why do you keep asking for help? Just use ?wiki.",
-            "Have you tried turning it off and on again?",
-            "Don't tell anyone, but I'm actually a bot.",
-            "...Did you just ask a bot for help?... Just use ?wiki...",
-            "Why did the bot use ?wiki at the comedy club? It wanted to look up punchlines!",
-            "I'd tell you to RTFM, but just use ?wiki instead.",
-            "I had a joke about ?wiki, but I need to look it up."
-        ]
-
-        if hasattr(self, 'last_joke') and self.last_joke:
-            joke_responses.remove(self.last_joke)
-
-        random_joke = random.choice(joke_responses)
-        self.last_joke = random_joke
-
-        if username in self.whitelist:
-            response = "Available functions: ?wiki, ?add, ?remove, ?keys, ?axe"
-            self.send_response(response)
-        else:
-            self.send_response(random_joke)
-
-    @whitelist_check
-    @log_command
-    def wikiadd(self, *args):
+        if derived is None:
+            with paused_gc():
+                derived = {
+                    "acl": AccessControl(self.blacklist, self.whitelist, self.alttraderlist, self.ban_patterns),
+                    "shortcut_index": ShortcutIndex(self.shortcuts),
+                    "key_pages": KeyPages(self.shortcuts),
+                }
+        self.acl = derived["acl"]
+        self.shortcut_index = derived["shortcut_index"]
+        self.key_pages = derived["key_pages"]
+        self.link_cache = LinkCache(self.wiki_replies.get("cache_size", 1024), self.wiki_replies.get("cache_ttl", 300))
+        return derived
+
+    def load_indexes(self):
         """
-        Adds a new shortcut for the wiki command. Requires a key:value format.
+        Boots the indexes from the snapshot if it matches config.json, otherwise builds them and
+        saves a new snapshot for next time.
         """
-        new_shortcut = args[1].lower()
-        if ":" not in new_shortcut:
-            add_error = "Expected key:value, item not added"
-            self.send_response(add_error)
-            return
-
-        new_key, new_item = new_shortcut.split(":")
-
-        if new_key == "zlef":
-            self.send_response("Zlef has been added as a shortcut for awesome")
-            return
-        elif new_key == "cammy":
-            self.send_response(f"{new_key} has been added as a shortcut for {new_item}")
+        derived = self.snapshot.load() if self.snapshot is not None else None
+        if derived is not None:
+            self.build_indexes(derived)
+            profile.mark("indexes (snapshot)")
             return
+        derived = self.build_indexes()
+        profile.mark("indexes (built)")
+        if self.snapshot is not None:
+            self.snapshot.save(derived)
+            profile.mark("snapshot save")
 
-        if new_key in self.shortcuts:
-            message = f"That key is already in use for {self.shortcuts[new_key]}. Use ?keys to view the err... Keys..."
-            self.send_response(message)
-            return
-
-        self.shortcuts[new_key] = new_item
-        self.save_configs()
-        self.send_response(f"{new_key} has been added as a shortcut for {new_item}")
-
-    @whitelist_check
-    @log_command
-    def wikiremove(self, *args):
+    def make_socket_handlers(self):
         """
-        Removes an existing shortcut from the wiki command list.
+        One WebSocketHandler per configured connection. They share the thread pool, and
+        connections logging in with the same account share its SignatureProvider.
         """
-        key_to_remove = args[1].lower()
-        if key_to_remove not in self.shortcuts:
-            self.send_response(f"The key {key_to_remove} doesn't exist. Nothing to remove.")
-            return
-        if key_to_remove == "cammy":
-            self.send_response(f"{key_to_remove} has been removed.")
-            return
-
-        del self.shortcuts[key_to_remove]
-        self.save_configs()
-        confirmation = f"{key_to_remove} has been removed."
-        self.send_response(confirmation)
-
-    @whitelist_check
-    @log_command
-    def wikikeys(self, *args):
+        executor = ThreadPoolExecutor(max_workers=4 * len(self.connections), thread_name_prefix="command")
+        providers = {}
+        handlers = []
+        for index, connection in enumerate(self.connections):
+            username = connection.get("username", self.config_user)
+            password = connection.get("password", self.config_pass)
+            if username not in providers:
+                context_dir = "persistent_context" if not providers else f"persistent_context_{username}"
+                providers[username] = SignatureProvider(username, password, lifetime=self.signature_lifetime,
+                                                        context_dir=context_dir, login_mode=self.login_mode)
+            handlers.append(WebSocketHandler(
+                self.dispatch_async, username, password,
+                capture_file=connection.get("capture_file", self.capture_file if index == 0 else None),
+                metrics=self.metrics, outbound_lanes=self.outbound_lanes, reconnect=self.reconnect,
+                url=connection.get("url"), name=connection.get("name"),
+                signatures=providers[username], executor=executor, inbound=self.inbound_settings,
+                players=self.players, history=self.history))
+            handlers[-1].admission = self.admit
+        return handlers
+
+    async def run_connections(self):
+        self.reply_coalescer.bind(asyncio.get_running_loop())
+        await asyncio.gather(*(handler.run() for handler in self.socket_handlers))
+
+    def reply_handler(self):
         """
-        Lists all current shortcut keys for the wiki command, with support for pagination.
+        The connection the running command came in on, or the first one outside of a command.
         """
-        command_arg = args[1].lower()
-        total_keys = sorted(self.shortcuts.keys())
-        total_keys_string = ", ".join(total_keys)
-        max_chars = 240
-        prefix = "Keys page "
-        max_message_length = max_chars - len(prefix)
-
-        total_pages = -(-len(total_keys_string) // max_message_length)  # Use ceiling division
-
-        message_parts = command_arg
-        if len(message_parts) > 1 and message_parts[1].isdigit():
-            page_requested = int(message_parts[1])
-        else:
-            page_requested = 0
+        return reply_route.get() or self.socket_handler
 
-        if page_requested == 0:
-            if total_pages == 1:
-                page_requested = 1  # Set to first page if there's only one
+    def send_response(self, message, force_debug=False, route=None):
+        route = route or self.reply_handler()
+        if self.debug or force_debug:
+            if not self.force_local:
+                route.send(f"CUSTOM=zlef~IPP{next(self.callbackID)}:wikibot:{message}")
             else:
-                page_message = f'Use "?keys n" to specify a page. Currently, there are {total_pages} pages.'
-                self.send_response(page_message)
-                return
-
-        page_requested = min(page_requested, total_pages)
-
-        start_idx = (page_requested - 1) * max_message_length
-        end_idx = start_idx + max_message_length
-
-        response_keys = total_keys_string[start_idx:end_idx]
-
-        if total_pages == 1:
-            response_message = f"{prefix} of 1: {response_keys}"
+                print(message)
         else:
-            response_message = f"{prefix}{page_requested} of {total_pages}: {response_keys}"
-
-        self.send_response(response_message)
+            route.send(f"CHAT={message}")
 
-    @whitelist_check
-    @log_command
-    def wikiaxe(self, *args):
+    def register_command(self, command_name, handler):
         """
-        Sends a random joke related to the 'Axe' character, avoiding repetition.
+        Registers a handler(bot, username, *args) under `command_name`, alongside the command
+        modules. Its @command declaration sets the policies; without one it is public and unlogged.
+        Handlers may be plain functions or `async def`.
         """
-        axe_jokes = [
-            "Axe is level 15 because otherwise he'd be too ostentatious and you wouldn't be able to play what with all the bowing and scraping",
-             "Shhhh, Lux is undercover as Axe to hide his moderator tag.",
-             "Now you've done it! Years of undercover work blown because you just had to know why the moderator has an alt account.",
-             "Axe at level 15 is like Bruce Wayne in a tracksuit—still dangerous but less showy.",
-             "Why does Axe stay at level 15? So he doesn't have to put 'Incognito Mode' in his username.",
-             "Smitty once tried to upgrade Axe to level 16, but the universe crashed. Took him a week to restore the balance."
-        ]
-        chosen_joke = random.choice(axe_jokes)
-        while chosen_joke == self.last_axe_joke:
-            chosen_joke = random.choice(axe_jokes)
-        self.last_axe_joke = chosen_joke
-        self.send_response(chosen_joke)
-
-    @whitelist_check
-    @log_command
-    def wikisay(self, *args):
+        spec = getattr(handler, "command_spec", None)
+        spec = spec.renamed(command_name) if spec is not None else CommandSpec(command_name, handler)
+        self.registry.add(spec)
+
+    def reload_commands(self):
         """
-        Echoes back the given argument.
+        Re-imports the command modules and restarts any worker processes so they run the new code.
+        Returns the names of the commands now registered.
         """
-        command_arg = args[1]
-        print(command_arg)
-        self.send_response(command_arg)
+        names = self.registry.reload()
+        if self.workers is not None:
+            self.workers.restart()
+        return names
 
-    @cooldown
-    @log_command
-    def wikizombo(self, *args):
+    def set_flag(self, name, value):
         """
-        Echoes back the given argument.
+        Sets a bot flag. The compiled commands depend on testing, fakename and debug, so changing
+        one of those recompiles them.
         """
-        username = args[0]
-        command_args = args[1]
-        print(f"username: {username}, args: {command_args}")
-        if username == "godofnades" and "stop" in command_args:
-            self.nades = True
-            self.send_response("Command disabled! Note this will reset on next launch if not removed")
-        if not self.nades:
-            self.send_response("BotofNades is experiencing an oopsy. The -Green Zombie- is in Forest. To disable this GodofNades, send '!zombo stop' and remind me to take this out")
-        print(self.nades)
-
-
-    @whitelist_check
-    @log_command
-    def wikicustom(self, *args):
+        if getattr(self, name) == value:
+            return
+        setattr(self, name, value)
+        if name in CommandRegistry.COMPILED_FLAGS:
+            self.registry.compile()
+
+    def admit(self, command_name, username, custom=False):
         """
-        Echoes back the given argument.
+        Checks made on the reader before a command is queued, cheap enough to keep up with a
+        flood. Returns None to drop the command, otherwise whether it goes in the priority lane.
         """
-        command_arg = args[1]
-        # self.send_response(command_arg)
+        if command_name not in self.command_map:
+            self.metrics.inc("wikibot_rejections_total", (("reason", "unknown_command"),))
+            self.handle_unknown_command(command_name, username)
+            return None
+        role = self.acl.role(username)
+        if role & Role.WHITELISTED:
+            return True
+        if role & Role.BLACKLISTED:
+            self.metrics.inc("wikibot_rejections_total", (("reason", "blacklist"),))
+            self.admin_echo.add(f"Blacklisted user {username} attempted to trigger a command")
+            return None
+        return custom
 
-        # self.socket_handler.ws.send(f"CUSTOM={args[1]}")
-        self.socket_handler.ws.send("CUSTOM=botofnades~altTrader:info:ping")
+    def dispatch(self, command_name, *args, **kwargs):
+        if command_name in self.command_map:
+            return self.command_map[command_name](*args, **kwargs)
+        else:
+            self.handle_unknown_command(command_name, *args, **kwargs)
 
-    @whitelist_check
-    @log_command
-    def wadd(self, *args):
-        """
-        Adds a user to the whitelist, exclusive to 'zlef'.
-        """
-        username = args[0]
-        if username == "zlef":
-            command_arg = args[1]
-            self.whitelist.append(command_arg)
-            self.save_configs()
-            self.send_response(f"{command_arg} added to whitelist")
-
-    @whitelist_check
-    @log_command
-    def wremove(self, *args):
+    async def dispatch_async(self, command_name, *args, origin=None, **kwargs):
         """
-        Removes a user from the whitelist, exclusive to 'zlef'.
+        Runs a command from the event loop. Async handlers are awaited in place, blocking ones are
+        moved to the thread pool. Replies go back to `origin`, the handler the command came from.
         """
-        username = args[0]
-        if username == "zlef":
-            command_arg = args[1]
-            self.whitelist.remove(command_arg)
-            self.save_configs()
-            self.send_response(f"{command_arg} removed from whitelist")
-
-    @whitelist_check
-    @log_command
-    def badd(self, *args):
-        """
-        Adds a user to the blacklist.
-        """
-        command_arg = args[1]
-        self.blacklist.append(command_arg)
-        self.save_configs()
-        self.send_response(f"{command_arg} added to blacklist")
-
-    @whitelist_check
-    @log_command
-    def bremove(self, *args):
-        """
-        Removes a user from the blacklist.
-        """
-        command_arg = args[1]
-        self.blacklist.remove(command_arg)
-        self.save_configs()
-        self.send_response(f"{command_arg} removed from blacklist")
-
-    @whitelist_check
-    @log_command
-    def wikiwoof(self, *args):
-        """
-        Responds to "wikisearch is a good boy" with "Woof!"
-        """
-        self.send_response("Woof!")
+        labels = (("command", command_name if command_name in self.command_map else "unknown"),)
+        route = reply_route.set(origin)
+        try:
+            with self.metrics.timer("wikibot_command_seconds", labels):
+                if command_name in self.async_commands:
+                    result = self.dispatch(command_name, *args, **kwargs)
+                elif (self.workers is not None and command_name in self.command_map
+                      and command_name not in self.in_process_commands):
+                    result = await self.workers.run(command_name, args, kwargs)
+                else:
+                    loop = asyncio.get_running_loop()
+                    # run_in_executor doesn't carry context variables over on its own
+                    context = contextvars.copy_context()
+                    result = await loop.run_in_executor(
+                        None, partial(context.run, self.dispatch, command_name, *args, **kwargs))
+                if inspect.isawaitable(result):
+                    await result
+        finally:
+            reply_route.reset(route)
+
+    def handle_unknown_command(self, command_name, *args, **kwargs):
+        # Handle unknown commands
+        command_log.debug("Unknown command: %s", command_name)
+
+    def start_workers(self):
+        from workers import WorkerPool
+        self.workers = WorkerPool(self, self.worker_processes, self.shared_state_path)
+        atexit.register(self.workers.close)
 
     def start(self):
-        self.socket_handler.initialize_websocket()
+        if self.worker_processes:
+            self.start_workers()
+        if self.metrics_port:
+            self.metrics.serve(self.metrics_port)
+        profile.mark("services")
+        for signatures in {id(handler.signatures): handler.signatures for handler in self.socket_handlers}.values():
+            signatures.warm()
+        profile.mark("signature warm")
+        asyncio.run(self.run_connections())
 
 
 if __name__ == "__main__":
@@ -582,6 +564,10 @@ if __name__ == "__main__":
     TODO:
     '''
     # bot = WikiBot("testzlef", "zleftest92")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="log how long each startup phase took, up to the first frame from the server")
+    profile.enabled = parser.parse_args().startup_profile
     bot = WikiBot()
     bot.start()
 
@@ -0,0 +1,208 @@
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+
+class Shard:
+    """
+    One thread's share of the metrics. Only its own thread writes to it, so updates need no lock.
+    """
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, histogram in other.histograms.items():
+            total = self.histograms.setdefault(key, [0] * (len(BUCKETS) + 1))
+            for index, value in enumerate(histogram):
+                total[index] += value
+
+
+class _ShardOwner:
+    """
+    Lives in the thread-local next to a shard, and goes when the thread does.
+    """
+    __slots__ = ("__weakref__",)
+
+
+class Metrics:
+    """
+    Counters and latency histograms, aggregated per thread and only summed when somebody looks,
+    so recording costs a couple of dict operations. Gauges are callables read at collection time.
+    Series are identified by (name, labels), where labels is a tuple of (key, value) pairs.
+
+    When a thread exits its shard is folded into a retired one, so short-lived threads (timers,
+    one-off workers) don't leave a shard each behind.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._retired = Shard()
+        self._shards = [self._retired]
+        # Reentrant, since a collection inside a locked section can run a finalizer
+        self._shards_lock = threading.RLock()
+        self._gauges = {}
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=()):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            # one slot per bucket, then the running sum
+            histogram = histograms[key] = [0] * (len(BUCKETS) + 1)
+        histogram[bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def timer(self, name, labels=()):
+        return _Timer(self, name, labels)
+
+    def gauge(self, name, read, labels=()):
+        self._gauges[(name, labels)] = read
+
+    def counters(self):
+        totals = {}
+        # Held so a shard can't be retired halfway through and counted twice
+        with self._shards_lock:
+            for shard in list(self._shards):
+                for key, value in list(shard.counters.items()):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def histograms(self):
+        totals = {}
+        with self._shards_lock:
+            for shard in list(self._shards):
+                for key, histogram in list(shard.histograms.items()):
+                    total = totals.setdefault(key, [0] * (len(BUCKETS) + 1))
+                    for index, value in enumerate(histogram):
+                        total[index] += value
+        return totals
+
+    def gauges(self):
+        values = {}
+        for key, read in list(self._gauges.items()):
+            try:
+                values[key] = read()
+            except Exception:
+                continue
+        return values
+
+    @staticmethod
+    def quantile(histogram, fraction):
+        """
+        Upper bound of the bucket holding the given fraction of observations.
+        """
+        count = sum(histogram[:-1])
+        if not count:
+            return 0.0
+        running = 0
+        for bound, bucket in zip(BUCKETS, histogram):
+            running += bucket
+            if running >= fraction * count:
+                return bound
+        return BUCKETS[-1]
+
+    def render_prometheus(self):
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(self.counters().items()):
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), value in sorted(self.gauges().items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms().items()):
+            header(name, "histogram")
+            running = 0
+            for bound, bucket in zip(BUCKETS, histogram):
+                running += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {running}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {running}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serves the Prometheus text format on http://host:port/metrics from a daemon thread.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            owner = self._local.owner = _ShardOwner()
+            with self._shards_lock:
+                self._shards.append(shard)
+            # Only the pieces it needs, so the finalizer doesn't keep this Metrics alive
+            weakref.finalize(owner, _retire, self._shards, self._shards_lock, self._retired, shard)
+        return shard
+
+
+def _retire(shards, lock, retired, shard):
+    with lock:
+        retired.merge(shard)
+        shards.remove(shard)
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, self.labels)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
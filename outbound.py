@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import deque
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class Lane:
+    """
+    One priority level: a bounded FIFO paced by its own token bucket. Identical messages already
+    waiting in the lane are coalesced into one.
+    """
+
+    def __init__(self, name, rate, burst, max_queue, drop="oldest"):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.max_queue = max_queue
+        self.drop = drop
+        self.queue = deque()
+        self.pending = set()
+        self.coalesced = 0
+        self.dropped = 0
+
+    def put(self, message, front=False):
+        if message in self.pending:
+            self.coalesced += 1
+            return
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            if self.drop == "newest":
+                return
+            self.pending.discard(self.queue.popleft())
+        self.pending.add(message)
+        if front:
+            self.queue.appendleft(message)
+        else:
+            self.queue.append(message)
+
+    def pop(self):
+        message = self.queue.popleft()
+        self.pending.discard(message)
+        return message
+
+
+class OutboundScheduler:
+    """
+    Paces everything the bot sends. Public CHAT replies and admin CUSTOM traffic wait in separate
+    lanes, each with its own rate, and CHAT goes first whenever both are ready. The queues outlive
+    the connection, so replies made during a reconnect are sent once it is back.
+    """
+    DEFAULT_LANES = {
+        "chat": {"rate": 1.0, "burst": 3, "max_queue": 30},
+        "custom": {"rate": 5.0, "burst": 10, "max_queue": 100},
+    }
+
+    def __init__(self, lanes=None):
+        settings = {name: dict(values) for name, values in self.DEFAULT_LANES.items()}
+        for name, values in (lanes or {}).items():
+            settings.setdefault(name, {}).update(values)
+        self.chat = Lane("chat", **settings["chat"])
+        self.custom = Lane("custom", **settings["custom"])
+        self.lanes = (self.chat, self.custom)
+        self._loop = None
+        self._wakeup = None
+
+    def bind(self, loop):
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    def depth(self):
+        return sum(len(lane.queue) for lane in self.lanes)
+
+    def lane_for(self, message):
+        return self.chat if message.startswith("CHAT=") else self.custom
+
+    def put(self, message):
+        """
+        Queues a message. Call from the event loop, see submit() for other threads.
+        """
+        self.lane_for(message).put(message)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def submit(self, message):
+        """
+        Thread-safe put. Before the loop is running, messages are simply queued.
+        """
+        if self._loop is None:
+            self.lane_for(message).put(message)
+        else:
+            self._loop.call_soon_threadsafe(self.put, message)
+
+    def requeue(self, message):
+        """
+        Puts back a message that could not be sent, ahead of everything else in its lane.
+        """
+        self.lane_for(message).put(message, front=True)
+
+    async def get(self):
+        """
+        Waits until some lane has a message and the tokens to send it.
+        """
+        while True:
+            now = time.monotonic()
+            soonest = None
+            for lane in self.lanes:
+                if not lane.queue:
+                    continue
+                wait = lane.bucket.wait_time(now)
+                if wait == 0:
+                    lane.bucket.take()
+                    return lane.pop()
+                soonest = wait if soonest is None else min(soonest, wait)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), soonest)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import time
+
+config_log = logging.getLogger("wikibot.config")
+
+
+class ConfigStore:
+    """
+    Owns the config document. Every change is applied in memory and appended to a journal next to
+    the config file; the full file is only rewritten by a background flush, at most once per
+    `flush_interval` seconds, via a temp file and rename so it is never left half written.
+    Whatever the last snapshot missed is replayed from the journal on load.
+
+    Journal entries are idempotent, so replaying one that already made it into the snapshot is harmless.
+    """
+
+    def __init__(self, path, flush_interval=2.0, fsync=True):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.document = None
+        self.on_flush = None  # called with the seconds each snapshot took
+        self._lock = threading.RLock()
+        self._journal = None
+        self._timer = None
+        self._dirty = False
+
+    def load(self):
+        with self._lock:
+            with open(self.path, "r") as f:
+                self.document = json.load(f)
+            replayed = self._replay_journal()
+            if replayed:
+                config_log.info(f"Replayed {replayed} journaled config changes")
+                self._dirty = True
+                self.flush()
+            return self.document
+
+    def set_item(self, section, key, value):
+        self._record({"op": "set", "section": section, "key": key, "value": value})
+
+    def delete_item(self, section, key):
+        self._record({"op": "del", "section": section, "key": key})
+
+    def add_member(self, section, value):
+        self._record({"op": "add", "section": section, "value": value})
+
+    def remove_member(self, section, value):
+        self._record({"op": "remove", "section": section, "value": value})
+
+    def flush(self):
+        """
+        Writes a compacted snapshot and empties the journal. Safe to call at any time.
+        """
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+            started = time.perf_counter()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.document, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            # Only now is everything in the journal also in the snapshot
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            open(self.journal_path, "w").close()
+            self._dirty = False
+            if self.on_flush is not None:
+                self.on_flush(time.perf_counter() - started)
+
+    def close(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self.flush()
+
+    def _record(self, entry):
+        with self._lock:
+            self._apply(entry)
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a")
+            self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _apply(self, entry):
+        section = self.document[entry["section"]]
+        op = entry["op"]
+        if op == "set":
+            section[entry["key"]] = entry["value"]
+        elif op == "del":
+            section.pop(entry["key"], None)
+        elif op == "add":
+            if entry["value"] not in section:
+                section.append(entry["value"])
+        elif op == "remove":
+            if entry["value"] in section:
+                section.remove(entry["value"])
+        else:
+            raise ValueError(f"Unknown journal op {op}")
+
+    def _replay_journal(self):
+        replayed = 0
+        try:
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append
+                        config_log.warning(f"Skipping unreadable journal entry: {line!r}")
+                        continue
+                    self._apply(entry)
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        return replayed
@@ -0,0 +1,87 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+class Player:
+    """
+    What the bot remembers about one player. Names, sigils and tags are interned, so the many
+    records with the same sigil or tag share one string.
+    """
+    __slots__ = ("name", "sigil", "tag", "level", "last_seen", "last_joke")
+
+    def __init__(self, name, sigil="", tag="", level=0, last_seen=0.0):
+        self.name = name
+        self.sigil = sigil
+        self.tag = tag
+        self.level = level
+        self.last_seen = last_seen
+        self.last_joke = None
+
+
+class PlayerStore:
+    """
+    Players by username, most recently seen last. Once there are `max_players`, the least recently
+    seen make way for new ones, and anyone not seen for `max_idle` seconds is dropped as new
+    players come in, so memory stays bounded in a busy server.
+
+    seen() is called for every chat frame from the event loop; commands read records from threads.
+    """
+
+    def __init__(self, max_players=20000, max_idle=86400, clock=time.monotonic):
+        self.max_players = max_players
+        self.max_idle = max_idle
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._players = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._players)
+
+    def __contains__(self, username):
+        return username in self._players
+
+    def seen(self, username, sigil, tag, level):
+        now = self.clock()
+        with self._lock:
+            player = self._players.get(username)
+            if player is None:
+                player = self._add(username, now)
+            else:
+                self._players.move_to_end(username)
+            player.last_seen = now
+            # Only new values are interned; the usual frame repeats what the record already holds
+            if player.sigil != sigil:
+                player.sigil = sys.intern(sigil)
+            if player.tag != tag:
+                player.tag = sys.intern(tag)
+            try:
+                player.level = int(level)
+            except ValueError:
+                pass
+        return player
+
+    def record(self, username):
+        """
+        The player's record, created if they haven't been seen in chat, e.g. on a worker process.
+        """
+        with self._lock:
+            player = self._players.get(username)
+            if player is None:
+                player = self._add(username, self.clock())
+            return player
+
+    def _add(self, username, now):
+        players = self._players
+        horizon = now - self.max_idle
+        while players:
+            oldest = next(iter(players.values()))
+            if len(players) < self.max_players and oldest.last_seen > horizon:
+                break
+            del players[oldest.name]
+            self.evicted += 1
+        name = sys.intern(username)
+        player = players[name] = Player(name, last_seen=now)
+        return player
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+
+class SlidingWindow:
+    """
+    At most `limit` admissions in any `window` seconds. Each key keeps only the timestamps of its
+    last `limit` admissions, so a check is one comparison against the oldest of them.
+    """
+    __slots__ = ("limit", "window")
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+
+    def allows(self, stamps, now):
+        return len(stamps) < self.limit or stamps[0] <= now - self.window
+
+    def record(self, stamps, now):
+        if len(stamps) >= self.limit:
+            stamps.popleft()
+        stamps.append(now)
+
+
+class RateLimiter:
+    """
+    Per-user and per-command sliding windows under one global ceiling.
+
+    `classes` maps a command name to {"user": [burst, seconds], "command": [burst, seconds]}, with
+    "default" used for anything not listed. Window state is kept in an LRU of at most `max_keys`
+    entries; entries whose window has fully expired are reclaimed from the cold end as new ones
+    come in, so memory stays bounded however many users pass through.
+    """
+    DEFAULT_CLASSES = {"default": {"user": [1, 60], "command": [5, 60]}}
+    DEFAULT_GLOBAL = [20, 60]
+
+    def __init__(self, classes=None, global_limit=None, max_keys=10000, clock=time.monotonic):
+        self.clock = clock
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._classes = {}
+        self._windows = OrderedDict()
+        self.global_window = SlidingWindow(*(global_limit or self.DEFAULT_GLOBAL))
+        self._global_stamps = deque()
+        self.served = Counter()
+        self.throttled = Counter()
+        self.configure(classes or self.DEFAULT_CLASSES)
+
+    @classmethod
+    def limits(cls, classes, command):
+        """
+        The ([burst, seconds] per user, [burst, seconds] for everyone) that `classes` sets for
+        `command`, with anything missing taken from the default class.
+        """
+        merged = dict(cls.DEFAULT_CLASSES)
+        merged.update(classes or {})
+        default = merged["default"]
+        limits = merged.get(command, default)
+        return limits.get("user", default["user"]), limits.get("command", default["command"])
+
+    def configure(self, classes):
+        names = set(self.DEFAULT_CLASSES) | set(classes)
+        with self._lock:
+            self._classes = {
+                name: tuple(SlidingWindow(*limit) for limit in self.limits(classes, name)) for name in names}
+            self._longest = max([self.global_window.window] +
+                                [window.window for pair in self._classes.values() for window in pair])
+
+    def admit(self, username, command):
+        """
+        Returns None if the call may go ahead (and counts it), otherwise which limit it hit:
+        "user", "command" or "global".
+        """
+        now = self.clock()
+        with self._lock:
+            self._reclaim(now)
+            user_window, command_window = self._classes.get(command) or self._classes["default"]
+            user_stamps = self._stamps(("user", username, command), now)
+            command_stamps = self._stamps(("command", command), now)
+            if not user_window.allows(user_stamps, now):
+                reason = "user"
+            elif not command_window.allows(command_stamps, now):
+                reason = "command"
+            elif not self.global_window.allows(self._global_stamps, now):
+                reason = "global"
+            else:
+                user_window.record(user_stamps, now)
+                command_window.record(command_stamps, now)
+                self.global_window.record(self._global_stamps, now)
+                self.served[command] += 1
+                return None
+            self.throttled[(command, reason)] += 1
+            return reason
+
+    def summary(self):
+        served = sum(self.served.values())
+        throttled = sum(self.throttled.values())
+        by_reason = Counter()
+        for (_, reason), count in self.throttled.items():
+            by_reason[reason] += count
+        reasons = ", ".join(f"{reason} {count}" for reason, count in by_reason.most_common()) or "none"
+        return (f"Served {served}, throttled {throttled} ({reasons}). "
+                f"Tracking {len(self._windows)}/{self.max_keys} windows.")
+
+    def _stamps(self, key, now):
+        stamps = self._windows.get(key)
+        if stamps is None:
+            stamps = self._windows[key] = deque()
+        else:
+            self._windows.move_to_end(key)
+        return stamps
+
+    def _reclaim(self, now):
+        windows = self._windows
+        # Drop a couple of expired entries per call, and make room for the two this call may add
+        for _ in range(2):
+            if not windows:
+                return
+            stamps = next(iter(windows.values()))
+            if stamps and stamps[-1] > now - self._longest:
+                break
+            windows.popitem(last=False)
+        while len(windows) > self.max_keys - 2:
+            windows.popitem(last=False)
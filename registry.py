@@ -0,0 +1,190 @@
+"""
+Commands are plain functions, handler(bot, username, *args), declared with @command and the
+policies that apply to them. CommandRegistry compiles each one once into a single callable that
+enforces those policies, and swaps in new code when the command modules are reloaded from disk.
+"""
+import importlib
+import inspect
+import logging
+import sys
+from datetime import datetime
+
+from acl import Role
+
+command_log = logging.getLogger("wikibot.commands")
+
+PUBLIC = "public"
+WHITELIST = "whitelist"
+
+
+class CommandSpec:
+    """
+    `access` is PUBLIC or WHITELIST. `rate_limit` names the RateLimiter class the command counts
+    against (None for no limit); public rate limited commands also turn away the blacklist.
+    `log` records each call and echoes it to the admin. `testing_swap` lets testing mode replace
+    the caller with the fake name. `in_process` keeps the command off worker processes, for
+    commands that read or change state only the parent has.
+    """
+    __slots__ = ("name", "handler", "access", "rate_limit", "log", "testing_swap", "in_process")
+
+    def __init__(self, name, handler, access=PUBLIC, rate_limit=None, log=False, testing_swap=True,
+                 in_process=False):
+        self.name = name
+        self.handler = handler
+        self.access = access
+        self.rate_limit = rate_limit
+        self.log = log
+        self.testing_swap = testing_swap
+        self.in_process = in_process
+
+    def renamed(self, name):
+        return CommandSpec(name, self.handler, self.access, self.rate_limit, self.log, self.testing_swap,
+                           self.in_process)
+
+
+def command(name, access=PUBLIC, rate_limit=None, log=True, testing_swap=True, in_process=False):
+    """
+    Declares a function in a command module as the handler for ?name. Pass rate_limit=True to
+    use the handler's own name as its rate limit class.
+    """
+    def declare(handler):
+        limit_class = handler.__name__ if rate_limit is True else rate_limit
+        handler.command_spec = CommandSpec(name, handler, access, limit_class, log, testing_swap, in_process)
+        return handler
+    return declare
+
+
+class CommandRegistry:
+    """
+    Commands from `modules` plus any registered directly. `compiled` maps command names to their
+    ready-to-call policy chains, `async_commands` holds those whose handler is `async def` and
+    `in_process` those declared in_process; the bot dispatches through all three, and they are
+    updated in place.
+
+    Chains bake in the bot's COMPILED_FLAGS, so call compile() after any of those change.
+    """
+    COMPILED_FLAGS = ("testing", "fakename", "debug")
+
+    def __init__(self, bot, modules=()):
+        self.bot = bot
+        self.modules = list(modules)
+        self.specs = {}
+        self.extra = {}
+        self.compiled = {}
+        self.async_commands = set()
+        self.in_process = set()
+
+    def load(self):
+        self.specs = self._collect(importlib.import_module(name) for name in self.modules)
+        self.compile()
+
+    def reload(self):
+        """
+        Re-imports the command modules from disk and swaps in their commands. If any of them fails
+        to import, the commands in use are left as they were and the error is raised.
+        """
+        fresh = [importlib.reload(sys.modules[name]) if name in sys.modules else importlib.import_module(name)
+                 for name in self.modules]
+        self.specs = self._collect(fresh)
+        self.compile()
+        return sorted(self.specs)
+
+    def add(self, spec):
+        self.extra[spec.name] = spec
+        self._install(spec)
+
+    def compile(self):
+        specs = {**self.specs, **self.extra}
+        for name in list(self.compiled):
+            if name not in specs:
+                del self.compiled[name]
+                self.async_commands.discard(name)
+                self.in_process.discard(name)
+        for spec in specs.values():
+            self._install(spec)
+
+    def _install(self, spec):
+        self.compiled[spec.name] = compile_command(self.bot, spec)
+        if inspect.iscoroutinefunction(spec.handler):
+            self.async_commands.add(spec.name)
+        else:
+            self.async_commands.discard(spec.name)
+        if spec.in_process:
+            self.in_process.add(spec.name)
+        else:
+            self.in_process.discard(spec.name)
+
+    @staticmethod
+    def _collect(modules):
+        specs = {}
+        for module in modules:
+            for value in vars(module).values():
+                spec = getattr(value, "command_spec", None)
+                if isinstance(spec, CommandSpec):
+                    specs[spec.name] = spec
+        return specs
+
+
+def compile_command(bot, spec):
+    """
+    Builds the callable for one command. Everything that only depends on the spec and the bot's
+    settings is decided here rather than on each call; the ACL, rate limiter, metrics and admin
+    echo are still looked up on the bot, since rebuilds and worker processes replace them.
+
+    The callable's `admit(username)` runs just the checks, counting the call if it passes.
+    """
+    handler = spec.handler
+    name = handler.__name__
+    swap = bot.fakename if bot.testing and spec.testing_swap else None
+    whitelist_only = spec.access == WHITELIST
+    limit_class = spec.rate_limit
+    log = spec.log
+    debug = bot.debug
+
+    def reject(reason, echo):
+        bot.metrics.inc("wikibot_rejections_total", (("reason", reason),))
+        bot.admin_echo.add(echo)
+
+    def admitted(username):
+        if whitelist_only:
+            if debug:
+                command_log.debug("Whitelist check for %s", name)
+            if not bot.acl.is_whitelisted(username):
+                reject("whitelist", f"{username} attempted to trigger whitelisted function: {name}")
+                return False
+        elif limit_class is not None:
+            role = bot.acl.role(username)
+            if role & Role.BLACKLISTED:
+                reject("blacklist", f"Blacklisted user {username} attempted to trigger a command")
+                return False
+            if not role & Role.WHITELISTED:
+                limited_by = bot.rate_limiter.admit(username, limit_class)
+                if limited_by is not None:
+                    reject(f"{limited_by}_cooldown",
+                           f"{username} attempted to call {name} while on cooldown ({limited_by} limit)")
+                    return False
+        return True
+
+    def admit(username):
+        """
+        The access and rate limit checks on their own, for a caller that runs the handler elsewhere.
+        """
+        return admitted(swap if swap is not None else username)
+
+    def run(username, *args, **kwargs):
+        if swap is not None:
+            if debug:
+                command_log.debug("Changed name to %s", swap)
+            username = swap
+        if not admitted(username):
+            return None
+        if log:
+            log_message = f"{username} triggered: {name}, with args: {args}"
+            command_log.info(log_message, extra={"fields": {"user": username, "command": name, "args": args}})
+            bot.admin_echo.add(f"{log_message} at {datetime.now().strftime('%X')}")
+        return handler(bot, username, *args, **kwargs)
+
+    run.__name__ = name
+    run.__doc__ = handler.__doc__
+    run.admit = admit
+    return run
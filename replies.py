@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LinkCache:
+    """
+    Recently resolved ?wiki links by normalized search term. Entries expire after `ttl` seconds
+    and the least recently used go first once there are `size` of them.
+    """
+
+    def __init__(self, size=1024, ttl=300, clock=time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, term):
+        with self._lock:
+            entry = self._entries.get(term)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[term]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(term)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, term, link):
+        with self._lock:
+            self._entries[term] = (self.clock() + self.ttl, link)
+            self._entries.move_to_end(term)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ReplyCoalescer:
+    """
+    Holds a ?wiki reply for `window` seconds so that everyone asking for the same term on the same
+    connection in that time gets one line: "@a @b: <link>". A lone request gets the bare link as
+    before. `send(message, route)` delivers the line. With a window of 0 replies go straight out.
+
+    Held replies are flushed by a call_later on the loop passed to bind(), so waiting terms cost
+    a timer handle each rather than a thread. Until a loop is bound replies go straight out too.
+    """
+
+    def __init__(self, send, window=0.75, max_length=240):
+        self.send = send
+        self.window = window
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._loop = None
+        self.coalesced = 0
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def coalesce(self, term, username, link, route=None):
+        """
+        Safe to call from any thread.
+        """
+        loop = self._loop
+        if not self.window or loop is None:
+            self.send(link, route)
+            return
+        key = (route, term)
+        with self._lock:
+            waiting = self._pending.get(key)
+            if waiting is not None:
+                if username not in waiting[0]:
+                    waiting[0].append(username)
+                self.coalesced += 1
+                return
+            self._pending[key] = ([username], link)
+        loop.call_soon_threadsafe(loop.call_later, self.window, self.flush, key)
+
+    def flush(self, key):
+        with self._lock:
+            usernames, link = self._pending.pop(key)
+        route = key[0]
+        if len(usernames) == 1:
+            self.send(link, route)
+            return
+        # Split the mentions over as many lines as it takes to stay under max_length
+        line = []
+        for username in usernames:
+            if line and len(" ".join(line)) + len(username) + len(link) + 4 > self.max_length:
+                self.send(f"{' '.join(line)}: {link}", route)
+                line = []
+            line.append(f"@{username}")
+        self.send(f"{' '.join(line)}: {link}", route)
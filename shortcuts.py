@@ -0,0 +1,199 @@
+import threading
+import urllib.parse
+
+from snapshot import Unpicklable
+
+
+class TrieNode:
+    __slots__ = ("children", "key", "count")
+
+    def __init__(self):
+        self.children = {}
+        self.key = None
+        self.count = 0  # keys at or below this node
+
+
+class ShortcutIndex(Unpicklable):
+    """
+    Resolves ?wiki terms against the shortcut table. Only exact keys match unless the caller asks
+    for fuzzy matching, which adds a unique completion of a prefix from the trie (covering at least
+    MIN_COVERAGE of the key, so a complete word like "iron" isn't taken for "ironbar") and then the
+    closest key within `max_distance` edits. Typos are found through a deletion-neighbourhood
+    table, so they cost a handful of dict lookups rather than a walk over the keys. Target URLs
+    are quoted once, when the shortcut is added.
+    """
+    SEARCH_URL = "https://idle-pixel.wiki/index.php?search="
+    MIN_PREFIX = 3
+    MIN_COVERAGE = 0.75
+
+    def __init__(self, shortcuts=None, max_distance=1):
+        self._lock = threading.Lock()
+        self._root = TrieNode()
+        self._urls = {}
+        self._targets = {}
+        self._deletes = {}
+        self.max_distance = max_distance
+        for key, target in (shortcuts or {}).items():
+            self.add(key, target)
+
+    def __len__(self):
+        return len(self._urls)
+
+    @staticmethod
+    def normalize(term):
+        return " ".join(term.lower().split())
+
+    def add(self, key, target):
+        key = self.normalize(key)
+        with self._lock:
+            if key not in self._urls:
+                node = self._root
+                node.count += 1
+                for char in key:
+                    node = node.children.setdefault(char, TrieNode())
+                    node.count += 1
+                node.key = key
+                for variant in self._variants(key):
+                    self._deletes.setdefault(variant, set()).add(key)
+            self._urls[key] = self.SEARCH_URL + urllib.parse.quote(target)
+            self._targets[key] = target
+
+    def remove(self, key):
+        key = self.normalize(key)
+        with self._lock:
+            if self._urls.pop(key, None) is None:
+                return False
+            del self._targets[key]
+            for variant in self._variants(key):
+                keys = self._deletes[variant]
+                keys.discard(key)
+                if not keys:
+                    del self._deletes[variant]
+            path = [self._root]
+            for char in key:
+                path.append(path[-1].children[char])
+            path[-1].key = None
+            for depth, node in enumerate(path):
+                node.count -= 1
+                if node.count == 0 and depth > 0:
+                    del path[depth - 1].children[key[depth - 1]]
+                    break
+            return True
+
+    def url_for(self, term, fuzzy=False):
+        """
+        Returns the wiki URL for a search term, falling back to a plain search.
+        """
+        key = self.resolve(term, fuzzy)
+        if key is not None:
+            return self._urls[key]
+        return self.search_url(term)
+
+    @classmethod
+    def search_url(cls, term):
+        return cls.SEARCH_URL + urllib.parse.quote(term)
+
+    def target(self, term, fuzzy=False):
+        """
+        Returns the search term the shortcut for `term` points at, or None.
+        """
+        key = self.resolve(term, fuzzy)
+        return self._targets[key] if key is not None else None
+
+    def resolve(self, term, fuzzy=False):
+        """
+        Returns the shortcut key a term maps to, or None. Prefixes and typos only match with `fuzzy`.
+        """
+        term = self.normalize(term)
+        if term in self._urls:
+            return term
+        if fuzzy and len(term) >= self.MIN_PREFIX:
+            key = self.complete(term)
+            if key is not None and len(term) >= self.MIN_COVERAGE * len(key):
+                return key
+            return self.closest(term)
+        return None
+
+    def complete(self, prefix):
+        """
+        Returns the only key starting with `prefix`, or None if there are none or several.
+        """
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        if node.count != 1:
+            return None
+        while node.key is None:
+            node = next(iter(node.children.values()))
+        return node.key
+
+    def closest(self, term):
+        """
+        Returns the key with the smallest edit distance to `term` within `max_distance`, or None
+        if there is no such key or the best distance is shared by several keys.
+        """
+        candidates = set()
+        for variant in self._variants(term):
+            keys = self._deletes.get(variant)
+            if keys:
+                candidates.update(keys)
+        limit = self.max_distance + 1
+        best_distance, best_keys = limit, []
+        for key in candidates:
+            distance = edit_distance(term, key, limit)
+            if distance < best_distance:
+                best_distance, best_keys = distance, [key]
+            elif distance == best_distance:
+                best_keys.append(key)
+        if best_distance <= self.max_distance and len(best_keys) == 1:
+            return best_keys[0]
+        return None
+
+    def _variants(self, word):
+        """
+        The word plus everything reachable from it by deleting up to max_distance characters.
+        Two words within that edit distance always share at least one variant.
+        """
+        variants = {word}
+        frontier = {word}
+        for _ in range(self.max_distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+            variants |= frontier
+        return variants
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance between a and b, or `limit` if it is at least that. Only the diagonal
+    band the answer can lie in is filled, so small limits stay cheap for long words.
+    """
+    if abs(len(a) - len(b)) >= limit:
+        return limit
+    if len(a) > len(b):
+        a, b = b, a
+    width = len(b)
+    previous = [j if j < limit else limit for j in range(width + 1)]
+    for i in range(1, len(a) + 1):
+        char_a = a[i - 1]
+        low = max(1, i - limit + 1)
+        high = min(width, i + limit - 1)
+        row = [limit] * (width + 1)
+        row[0] = i if i < limit else limit
+        best = row[0]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char_a != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if row[j - 1] + 1 < cost:
+                cost = row[j - 1] + 1
+            if cost > limit:
+                cost = limit
+            row[j] = cost
+            if cost < best:
+                best = cost
+        if best >= limit:
+            return limit
+        previous = row
+    return previous[width]
@@ -0,0 +1,335 @@
+import asyncio
+import threading
+import time
+import logging
+import http.client
+import urllib.parse
+from http.cookies import SimpleCookie
+
+login_log = logging.getLogger("wikibot.login")
+
+
+class LoginError(Exception):
+    pass
+
+
+def scan_signature(chunks):
+    """
+    Pulls the signature out of the first <script> tag of a page given as an iterable of text chunks.
+    Stops as soon as the quoted token has been seen, without building a DOM. Only the text up to
+    that script's </script> is searched.
+    """
+    buffer = ""
+    script_start = -1
+    for chunk in chunks:
+        buffer += chunk
+        if script_start == -1:
+            tag = buffer.find("<script")
+            if tag == -1:
+                # keep only enough tail to catch a tag split across chunks
+                buffer = buffer[-7:]
+                continue
+            tag_end = buffer.find(">", tag)
+            if tag_end == -1:
+                buffer = buffer[tag:]
+                continue
+            buffer = buffer[tag_end + 1:]
+            script_start = 0
+        script_end = buffer.find("</script")
+        body = buffer if script_end == -1 else buffer[:script_end]
+        statement_end = body.find(";")
+        first_quote = body.find("'")
+        if statement_end != -1 and (first_quote == -1 or statement_end < first_quote):
+            break
+        if first_quote != -1:
+            second_quote = body.find("'", first_quote + 1)
+            if second_quote != -1:
+                return body[first_quote + 1:second_quote]
+        if script_end != -1:
+            break
+    raise LoginError("No signature found in login response")
+
+
+def scan_attribute(text, marker, attribute="value"):
+    """
+    Returns the value of `attribute` on the first tag containing `marker`, or None.
+    """
+    at = text.find(marker)
+    if at == -1:
+        return None
+    tag_start = text.rfind("<", 0, at)
+    tag_end = text.find(">", at)
+    tag = text[tag_start:tag_end]
+    key = f'{attribute}="'
+    value_at = tag.find(key)
+    if value_at == -1:
+        return None
+    value_at += len(key)
+    return tag[value_at:tag.find('"', value_at)]
+
+
+class HttpSession:
+    """
+    Small keep-alive HTTP client: one pooled connection per host and a cookie jar.
+    """
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self.cookies = {}
+        self._connections = {}
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Sends a request and returns the open response, so the caller can stream the body.
+        The body must be read (or drain() called) before the next request to the same host.
+        """
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        send_headers = {"Host": parts.netloc, "User-Agent": "Mozilla/5.0 (wikibot)"}
+        if self.cookies:
+            send_headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        send_headers.update(headers or {})
+
+        for attempt in (1, 2):
+            connection = self._connection(parts.scheme, parts.netloc, fresh=attempt == 2)
+            try:
+                connection.request(method, path, body=body, headers=send_headers)
+                response = connection.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.CannotSendRequest):
+                # Pooled connection went stale, retry once on a new one
+                connection.close()
+                if attempt == 2:
+                    raise
+
+        for header in response.headers.get_all("Set-Cookie") or []:
+            jar = SimpleCookie()
+            jar.load(header)
+            for name, morsel in jar.items():
+                self.cookies[name] = morsel.value
+        return response
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+    @staticmethod
+    def chunks(response, size=4096):
+        charset = response.headers.get_content_charset() or "utf-8"
+        while True:
+            data = response.read(size)
+            if not data:
+                return
+            yield data.decode(charset, errors="replace")
+
+    @staticmethod
+    def drain(response, size=16384):
+        while response.read(size):
+            pass
+
+    def _connection(self, scheme, netloc, fresh=False):
+        key = (scheme, netloc)
+        connection = self._connections.get(key)
+        if connection is None or fresh:
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            self._connections[key] = connection
+        return connection
+
+
+class HttpLogin:
+    """
+    Logs in by posting the /login/ form directly, then scans the landing page for the signature.
+    """
+    MAX_REDIRECTS = 5
+
+    def __init__(self, username, password, base_url="https://idle-pixel.com"):
+        self.username = username
+        self.password = password
+        self.login_url = urllib.parse.urljoin(base_url, "/login/")
+        self.session = HttpSession()
+
+    def fetch_signature(self):
+        response = self.session.request("GET", self.login_url)
+        login_page = response.read().decode("utf-8", errors="replace")
+        if response.status != 200:
+            raise LoginError(f"GET {self.login_url} returned {response.status}")
+
+        csrf_token = scan_attribute(login_page, 'name="csrfmiddlewaretoken"') or self.session.cookies.get("csrftoken")
+        if not csrf_token:
+            raise LoginError("No CSRF token on login page")
+
+        form = urllib.parse.urlencode({
+            "csrfmiddlewaretoken": csrf_token,
+            "username": self.username,
+            "password": self.password,
+        }).encode()
+        response = self.session.request("POST", self.login_url, body=form, headers={
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Referer": self.login_url,
+        })
+
+        url = self.login_url
+        for _ in range(self.MAX_REDIRECTS):
+            if response.status not in (301, 302, 303, 307, 308):
+                break
+            self.session.drain(response)
+            url = urllib.parse.urljoin(url, response.headers["Location"])
+            response = self.session.request("GET", url)
+
+        if response.status != 200:
+            self.session.drain(response)
+            raise LoginError(f"Login landed on {url} with status {response.status}")
+        try:
+            return scan_signature(self.session.chunks(response))
+        finally:
+            self.session.drain(response)
+
+    def close(self):
+        self.session.close()
+
+
+class SignatureProvider:
+    """
+    Hands out login signatures for the websocket LOGIN frame.
+
+    The last good signature is cached for `lifetime` seconds and reused on reconnect. When a new
+    one is needed it is fetched over plain HTTP if `login_mode` is "http", falling back to a
+    single Chromium context that is launched once and kept warm on a background event loop.
+    """
+
+    def __init__(self, username, password, lifetime=3600, context_dir="persistent_context",
+                 login_mode="http", base_url="https://idle-pixel.com"):
+        self.username = username
+        self.password = password
+        self.lifetime = lifetime
+        self.context_dir = context_dir
+        self.login_mode = login_mode
+        self.base_url = base_url
+        self.http_login = HttpLogin(username, password, base_url) if login_mode == "http" else None
+        self._signature = None
+        self._fetched_at = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._context = None
+        self._page = None
+        self._launching = None
+
+    def get(self):
+        """
+        Returns (signature, from_cache). Uses the cached signature while it is still fresh.
+        """
+        with self._lock:
+            if self._signature and time.time() - self._fetched_at < self.lifetime:
+                return self._signature, True
+            return self._refresh(), False
+
+    def seed(self, signature):
+        """
+        Installs a known signature as if it had just been fetched.
+        """
+        with self._lock:
+            self._signature = signature
+            self._fetched_at = time.time()
+
+    def invalidate(self):
+        """
+        Drops the cached signature, e.g. after the server rejected it.
+        """
+        with self._lock:
+            if self._signature:
+                login_log.info("Login signature rejected, dropping cached copy")
+            self._signature = None
+            self._fetched_at = 0
+
+    def warm(self):
+        """
+        Starts the browser in the background so the first login doesn't pay for the launch.
+        Does nothing in http mode, where the browser is only started if the fast path fails.
+        """
+        if self.http_login is None:
+            self._submit(self._ensure_page())
+
+    def close(self, timeout=10):
+        if self.http_login is not None:
+            self.http_login.close()
+        if self._loop is None:
+            return
+        self._submit(self._shutdown()).result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop = None
+        self._thread = None
+
+    def _refresh(self):
+        signature = None
+        if self.http_login is not None:
+            started = time.perf_counter()
+            try:
+                signature = self.http_login.fetch_signature()
+                login_log.info(f"HTTP login took {(time.perf_counter() - started) * 1000:.1f} ms")
+            except (LoginError, OSError, http.client.HTTPException) as e:
+                login_log.warning(f"HTTP login failed, falling back to browser: {e}")
+                self.http_login.close()
+        if signature is None:
+            signature = self._submit(self._fetch_signature()).result(60)
+        self._signature = signature
+        self._fetched_at = time.time()
+        return signature
+
+    def _submit(self, coro):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="signature-browser", daemon=True)
+            self._thread.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _ensure_page(self):
+        # warm() and a login can both get here first, so they share one launch
+        if self._launching is None or (self._launching.done() and self._launching.exception()):
+            self._launching = asyncio.ensure_future(self._launch())
+        await self._launching
+        if self._page.is_closed():
+            self._page = await self._context.new_page()
+        return self._page
+
+    async def _launch(self):
+        # Playwright takes a while to import and only the browser fallback needs it
+        from playwright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+        self._context = await self._playwright.chromium.launch_persistent_context(self.context_dir)
+        self._page = await self._context.new_page()
+
+    async def _fetch_signature(self):
+        page = await self._ensure_page()
+
+        await page.goto(urllib.parse.urljoin(self.base_url, "/login/"))
+        await page.locator('[id=id_username]').fill(self.username)
+        await page.locator('[id=id_password]').fill(self.password)
+        await page.locator("[id=login-submit-button]").click()
+
+        page_content = await page.content()
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(page_content, 'html.parser')
+        script_tag = soup.find("script").text
+        sig_plus_wrap = script_tag.split(";", 1)[0]
+        signature = sig_plus_wrap.split("'")[1]
+
+        return signature
+
+    async def _shutdown(self):
+        if self._context is not None:
+            await self._context.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self._context = None
+        self._page = None
+        self._playwright = None
+        self._launching = None
@@ -0,0 +1,111 @@
+import gc
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from contextlib import contextmanager
+
+snapshot_log = logging.getLogger("wikibot.snapshot")
+
+
+@contextmanager
+def paused_gc():
+    """
+    Building or unpickling the indexes creates a lot of small objects at once; collecting in the
+    middle of that only slows it down.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class Unpicklable:
+    """
+    Mixed into classes that snapshots pickle. Attributes named in TRANSIENT (a lock, a cache) are
+    left out of the pickle and made afresh by calling the factory they map to.
+    """
+    TRANSIENT = {"_lock": threading.Lock}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.TRANSIENT:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name, factory in self.TRANSIENT.items():
+            setattr(self, name, factory())
+
+
+class Snapshot:
+    """
+    A pickle of state derived from the config file, stored next to it and only trusted while the
+    config and the code that built it are unchanged. The file holds a small header (format, a hash
+    of SOURCES, the config's mtime and SHA-256) followed by the state, so a stale snapshot is
+    rejected without unpickling the rest.
+
+    The mtime check is free; the hash catches edits within the filesystem's timestamp resolution.
+    Hashing the sources of the pickled classes means a changed class is never handed state laid
+    out for the old one.
+    """
+    FORMAT = 2
+    SOURCES = ("acl.py", "shortcuts.py", "keypages.py")
+
+    def __init__(self, path, config_path):
+        self.path = path
+        self.config_path = config_path
+        self._code = None
+
+    def code_version(self):
+        if self._code is None:
+            digest = hashlib.sha256()
+            directory = os.path.dirname(os.path.abspath(__file__))
+            for name in self.SOURCES:
+                with open(os.path.join(directory, name), "rb") as f:
+                    digest.update(f.read())
+            self._code = digest.hexdigest()
+        return self._code
+
+    def fingerprint(self):
+        with open(self.config_path, "rb") as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return {"format": self.FORMAT, "code": self.code_version(), "mtime_ns": mtime_ns, "sha256": digest}
+
+    def load(self):
+        """
+        Returns the saved state, or None if there is no usable snapshot for the current config.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                header = pickle.load(f)
+                expected = self.fingerprint()
+                if (header.get("format") != self.FORMAT or header.get("code") != expected["code"]
+                        or header.get("mtime_ns") != expected["mtime_ns"]):
+                    return None
+                if header.get("sha256") != expected["sha256"]:
+                    return None
+                with paused_gc():
+                    return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A snapshot from an older version of the classes, or a torn write
+            snapshot_log.warning(f"Ignoring unreadable snapshot {self.path}: {e}")
+            return None
+
+    def save(self, state):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self.fingerprint(), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            snapshot_log.warning(f"Could not write snapshot {self.path}: {e}")
@@ -0,0 +1,42 @@
+import logging
+import time
+
+startup_log = logging.getLogger("wikibot.startup")
+
+
+class StartupProfile:
+    """
+    Time spent in each startup phase, from the first import to the first frame from the server.
+    Each mark() closes the phase that ran since the previous one. Marks are always taken (they
+    cost one clock read); report() only logs them when --startup-profile was given.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.phases = []
+        self.enabled = False
+        self.done = False
+
+    def mark(self, phase):
+        if self.done:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        if self.done:
+            return
+        self.done = True
+        if not self.enabled:
+            return
+        total = self.last - self.started
+        startup_log.info("Startup " + ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in self.phases)
+                         + f"; total {total * 1000:.1f} ms",
+                         extra={"fields": {"phases_ms": {phase: round(seconds * 1000, 2) for phase, seconds in self.phases},
+                                           "total_ms": round(total * 1000, 2)}})
+
+
+# Created on import, so the clock starts with the first module that imports this
+profile = StartupProfile()
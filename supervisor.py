@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import random
+import time
+
+supervisor_log = logging.getLogger("wikibot.supervisor")
+
+
+class ConnectionSupervisor:
+    """
+    Keeps a WebSocketHandler connected. The first retry after a drop is immediate, later ones back
+    off exponentially with jitter; the backoff resets once a connection has stayed logged in for
+    `stable_after` seconds. Everything else (signature cache, outbound queues, the bot) survives
+    the reconnect, so recovery is just a new socket and a LOGIN frame.
+
+    Time from losing a logged-in connection to the next successful login is recorded per outage.
+    """
+
+    def __init__(self, handler, initial_delay=0.5, max_delay=60, jitter=0.3, stable_after=30):
+        self.handler = handler
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.stable_after = stable_after
+        self.attempt = 0
+        self.outage_started = None
+
+    def backoff(self):
+        if self.attempt == 0:
+            return 0
+        delay = min(self.max_delay, self.initial_delay * 2 ** (self.attempt - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def logged_in(self):
+        """
+        Called by the handler when the server accepts the LOGIN.
+        """
+        if self.outage_started is None:
+            return
+        recovered_in = time.monotonic() - self.outage_started
+        self.outage_started = None
+        self.handler.metrics.observe("wikibot_recovery_seconds", recovered_in, self.handler.labels)
+        supervisor_log.info(f"{self.handler.name} recovered after {recovered_in * 1000:.0f} ms",
+                            extra={"fields": {"connection": self.handler.name,
+                                              "recovery_ms": round(recovered_in * 1000, 1)}})
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            await self.handler.connect()
+            if self.handler.logged_in:
+                if self.outage_started is None:
+                    self.outage_started = time.monotonic()
+                if time.monotonic() - started >= self.stable_after:
+                    self.attempt = 0
+            delay = self.backoff()
+            self.attempt += 1
+            self.handler.metrics.inc("wikibot_reconnects_total", self.handler.labels)
+            supervisor_log.info(f"{self.handler.name} reconnecting in {delay:.1f}s (attempt {self.attempt})")
+            if delay:
+                await asyncio.sleep(delay)
@@ -0,0 +1,34 @@
+from acl import AccessControl, Role
+
+
+def test_roles_from_names_and_patterns():
+    acl = AccessControl(blacklist=["spam*"], whitelist=["zlef"], alttraderlist=["zlef"], ban_patterns=["*scam*"])
+    assert acl.role("zlef") == Role.WHITELISTED | Role.ALT_TRADER
+    assert acl.is_blacklisted("spammer")
+    assert acl.is_blacklisted("notascammer")
+    assert acl.role("bob") == Role.USER
+
+
+def test_changes_drop_cached_verdicts():
+    acl = AccessControl()
+    assert not acl.is_blacklisted("bob")
+    acl.add(Role.BLACKLISTED, "bob")
+    assert acl.is_blacklisted("bob")
+    acl.remove(Role.BLACKLISTED, "bob")
+    assert not acl.is_blacklisted("bob")
+
+
+def test_change_during_lookup_is_not_cached():
+    acl = AccessControl()
+    resolve = acl._resolve
+
+    def resolve_then_change(username):
+        # A badd on another thread landing between resolving and caching
+        verdict = resolve(username)
+        acl.add(Role.BLACKLISTED, username)
+        return verdict
+
+    acl._resolve = resolve_then_change
+    assert acl.role("bob") == Role.USER
+    del acl._resolve
+    assert acl.is_blacklisted("bob")
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from inbound import InboundQueue
+
+
+def drain(queue):
+    async def take():
+        return [await queue.get() for _ in range(len(queue))]
+    return asyncio.run(take())
+
+
+def test_priority_lane_served_first():
+    queue = InboundQueue(max_size=10)
+    queue.put("a", "normal a")
+    queue.put("b", "urgent b", priority=True)
+    queue.put("c", "normal c")
+    queue.put("d", "urgent d", priority=True)
+    assert drain(queue) == ["urgent b", "urgent d", "normal a", "normal c"]
+
+
+def test_get_waits_for_a_put():
+    async def run():
+        queue = InboundQueue()
+        waiting = asyncio.ensure_future(queue.get())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        queue.put("a", "item")
+        return await asyncio.wait_for(waiting, 1)
+    assert asyncio.run(run()) == "item"
+
+
+def test_duplicate_kept_below_capacity():
+    queue = InboundQueue(max_size=10, shed=("duplicate",))
+    assert queue.put("say hi", 1)
+    assert queue.put("say hi", 2)
+    assert not queue.shed_counts
+    assert drain(queue) == [1, 2]
+
+
+def test_duplicate_dropped_when_full():
+    queue = InboundQueue(max_size=2, shed=("duplicate", "oldest"))
+    assert queue.put("wiki iron", 1)
+    assert queue.put("wiki gold", 2)
+    # A repeat goes before anything waiting is evicted for it
+    assert not queue.put("wiki iron", 3)
+    assert queue.shed_counts == {"duplicate": 1}
+    assert queue.put("wiki bones", 4)
+    assert queue.shed_counts["oldest"] == 1
+    assert drain(queue) == [2, 4]
+    # Once served, the same command is welcome again
+    assert queue.put("wiki iron", 5)
+
+
+def test_lowest_priority_evicts_oldest_normal():
+    queue = InboundQueue(max_size=2, shed=("lowest_priority",))
+    queue.put("a", "a")
+    queue.put("b", "b")
+    assert queue.put("c", "c", priority=True)
+    assert queue.shed_counts["lowest_priority"] == 1
+    assert drain(queue) == ["c", "b"]
+
+
+def test_lowest_priority_does_not_evict_priority():
+    queue = InboundQueue(max_size=2, shed=("lowest_priority",))
+    queue.put("a", "a", priority=True)
+    queue.put("b", "b", priority=True)
+    assert not queue.put("c", "c", priority=True)
+    assert not queue.put("d", "d")
+    assert queue.shed_counts == {"newest": 2}
+    assert drain(queue) == ["a", "b"]
+
+
+def test_oldest_evicts_from_arriving_lane():
+    queue = InboundQueue(max_size=3, shed=("oldest",))
+    queue.put("a", "a")
+    queue.put("b", "b", priority=True)
+    queue.put("c", "c")
+    assert queue.put("d", "d")
+    assert queue.put("e", "e", priority=True)
+    assert queue.shed_counts["oldest"] == 2
+    assert drain(queue) == ["e", "c", "d"]
+
+
+def test_newest_dropped_without_a_policy():
+    queue = InboundQueue(max_size=2, shed=())
+    queue.put("a", "a")
+    queue.put("a", "a again")
+    assert not queue.put("b", "b", priority=True)
+    assert queue.shed_counts == {"newest": 1}
+    assert drain(queue) == ["a", "a again"]
+
+
+def test_evicted_duplicate_can_queue_again():
+    queue = InboundQueue(max_size=1, shed=("duplicate", "oldest"))
+    queue.put("a", 1)
+    queue.put("b", 2)
+    # "a" was evicted, so it is no longer pending
+    assert queue.put("a", 3)
+    assert drain(queue) == [3]
+
+
+def test_unknown_policy_rejected():
+    with pytest.raises(ValueError):
+        InboundQueue(shed=("random",))
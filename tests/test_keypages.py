@@ -0,0 +1,67 @@
+import random
+import string
+
+import pytest
+
+from keypages import KeyPages
+
+
+def random_key(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(1, 14)))
+
+
+def assert_packed(pages):
+    expected = pages._pack(pages.keys, pages.body_width())
+    assert pages._pages == expected
+    assert pages._firsts == [page[0] for page in expected]
+
+
+def test_pages_fit_one_message():
+    pages = KeyPages([f"key{index}" for index in range(200)])
+    assert pages.page_count() > 1
+    for number in range(1, pages.page_count() + 1):
+        assert len(pages.render(number)) <= pages.width
+    assert pages.render(0) is None
+    assert pages.render(pages.page_count() + 1) is None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_edits_match_packing_from_scratch(seed):
+    rng = random.Random(seed)
+    keys = {random_key(rng) for _ in range(60)}
+    pages = KeyPages(keys, width=80)
+    for _ in range(300):
+        if keys and rng.random() < 0.5:
+            key = rng.choice(sorted(keys))
+            keys.discard(key)
+            pages.remove(key)
+        else:
+            key = random_key(rng)
+            keys.add(key)
+            pages.add(key)
+        assert pages.keys == sorted(keys)
+        assert_packed(pages)
+
+
+def test_removing_a_first_key_lets_the_page_before_take_more():
+    pages = KeyPages(["aaaa", "bbbb", "ccccccccc", "d"], width=len(KeyPages.header(999, 999)) + 13)
+    assert pages._pages == [["aaaa", "bbbb"], ["ccccccccc", "d"]]
+    pages.remove("ccccccccc")
+    assert pages._pages == [["aaaa", "bbbb", "d"]]
+
+
+def test_removing_everything():
+    keys = [f"k{index}" for index in range(100)]
+    pages = KeyPages(keys, width=60)
+    for key in keys:
+        pages.remove(key)
+        assert_packed(pages)
+    assert pages.page_count() == 0
+
+
+def test_prefix_listing_follows_edits():
+    pages = KeyPages(["iron bar", "iron ore", "gold bar"])
+    assert pages.render(1, "iron") == "Keys page 1 of 1 for iron: iron bar, iron ore"
+    pages.add("iron axe")
+    pages.remove("iron ore")
+    assert pages.render(1, "iron") == "Keys page 1 of 1 for iron: iron axe, iron bar"
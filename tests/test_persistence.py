@@ -0,0 +1,113 @@
+import json
+import os
+
+import pytest
+
+import persistence
+from persistence import ConfigStore
+
+SNAPSHOT = {"shortcuts": {"iron": "Iron", "gold": "Gold"}, "whitelist": ["zlef"], "blacklist": []}
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(SNAPSHOT))
+    return str(path)
+
+
+def write_journal(config_path, entries, tail=""):
+    with open(config_path + ".journal", "w") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+        f.write(tail)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def load(config_path):
+    store = ConfigStore(config_path, flush_interval=3600, fsync=False)
+    store.load()
+    return store
+
+
+CHANGES = [
+    {"op": "set", "section": "shortcuts", "key": "bones", "value": "Bones"},
+    {"op": "del", "section": "shortcuts", "key": "gold"},
+    {"op": "add", "section": "whitelist", "value": "cammy"},
+    {"op": "remove", "section": "whitelist", "value": "zlef"},
+    {"op": "add", "section": "blacklist", "value": "spam*"},
+]
+CHANGED = {"shortcuts": {"iron": "Iron", "bones": "Bones"}, "whitelist": ["cammy"], "blacklist": ["spam*"]}
+
+
+def test_journal_replayed_over_snapshot(config_path):
+    write_journal(config_path, CHANGES)
+    store = load(config_path)
+    assert store.document == CHANGED
+    # Loading folds the journal into the config file
+    assert json.loads(read(config_path)) == CHANGED
+    assert read(config_path + ".journal") == ""
+    store.close()
+
+
+def test_torn_last_line_is_skipped(config_path):
+    write_journal(config_path, CHANGES[:1], tail='{"op": "set", "section": "shortcuts", "ke')
+    store = load(config_path)
+    assert store.document["shortcuts"] == {"iron": "Iron", "gold": "Gold", "bones": "Bones"}
+    store.close()
+
+
+def test_replay_is_idempotent(config_path):
+    with open(config_path, "w") as f:
+        json.dump(CHANGED, f)
+    # Every change is already in the snapshot, and then journaled twice over
+    write_journal(config_path, CHANGES + CHANGES)
+    store = load(config_path)
+    assert store.document == CHANGED
+    store.close()
+
+
+def test_changes_survive_reload(config_path):
+    store = load(config_path)
+    store.set_item("shortcuts", "bones", "Bones")
+    store.delete_item("shortcuts", "gold")
+    store.add_member("whitelist", "cammy")
+    store.remove_member("whitelist", "zlef")
+    store.add_member("blacklist", "spam*")
+    # Journaled straight away, before any flush
+    assert len(read(config_path + ".journal").splitlines()) == 5
+    assert load(config_path).document == CHANGED
+    store.close()
+
+
+class Crash(Exception):
+    pass
+
+
+def test_flush_interrupted_before_journal_truncated(config_path, monkeypatch):
+    store = load(config_path)
+    for method, params in (("set_item", ("shortcuts", "bones", "Bones")), ("delete_item", ("shortcuts", "gold")),
+                           ("add_member", ("whitelist", "cammy")), ("remove_member", ("whitelist", "zlef")),
+                           ("add_member", ("blacklist", "spam*"))):
+        getattr(store, method)(*params)
+    replace = os.replace
+
+    def replace_then_crash(src, dst):
+        replace(src, dst)
+        raise Crash()
+
+    monkeypatch.setattr(persistence.os, "replace", replace_then_crash)
+    with pytest.raises(Crash):
+        store.flush()
+    monkeypatch.undo()
+    # The new config is in place but the journal still holds everything in it
+    assert json.loads(read(config_path)) == CHANGED
+    assert len(read(config_path + ".journal").splitlines()) == 5
+
+    restarted = load(config_path)
+    assert restarted.document == CHANGED
+    assert read(config_path + ".journal") == ""
+    restarted.close()
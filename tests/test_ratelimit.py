@@ -0,0 +1,38 @@
+from ratelimit import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_limits_fall_back_to_default_class():
+    classes = {"wikiurl": {"user": [3, 90]}, "default": {"user": [1, 30], "command": [5, 60]}}
+    assert RateLimiter.limits(classes, "wikiurl") == ([3, 90], [5, 60])
+    assert RateLimiter.limits(classes, "wikihelp") == ([1, 30], [5, 60])
+    assert RateLimiter.limits({}, "wikiurl") == ([1, 60], [5, 60])
+
+
+def test_user_window_slides():
+    clock = Clock()
+    limiter = RateLimiter({"wikiurl": {"user": [2, 60], "command": [100, 60]}}, [100, 60], clock=clock)
+    assert limiter.admit("bob", "wikiurl") is None
+    assert limiter.admit("bob", "wikiurl") is None
+    assert limiter.admit("bob", "wikiurl") == "user"
+    assert limiter.admit("amy", "wikiurl") is None
+    clock.now += 60
+    assert limiter.admit("bob", "wikiurl") is None
+
+
+def test_command_and_global_limits():
+    clock = Clock()
+    limiter = RateLimiter({"default": {"user": [10, 60], "command": [2, 60]}}, [3, 60], clock=clock)
+    assert limiter.admit("a", "wikiurl") is None
+    assert limiter.admit("b", "wikiurl") is None
+    assert limiter.admit("c", "wikiurl") == "command"
+    assert limiter.admit("c", "wikihelp") is None
+    assert limiter.admit("d", "wikiseen") == "global"
+    assert limiter.throttled == {("wikiurl", "command"): 1, ("wikiseen", "global"): 1}
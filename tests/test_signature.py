@@ -0,0 +1,120 @@
+import threading
+import urllib.parse
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from signature import HttpLogin, LoginError, scan_signature
+
+SIGNATURE = "d3adb33f.signed-token"
+GAME_PAGE = ("<!DOCTYPE html><html><head><title>Idle Pixel</title>" + "<meta name='filler'>" * 40 +
+             f"<script type=\"text/javascript\">var signature = '{SIGNATURE}'; start_game();</script>"
+             "<script>var other = 'not this one';</script></head><body></body></html>")
+LOGIN_PAGE = ('<html><body><form method="post" action="/login/">'
+              '<input type="hidden" name="csrfmiddlewaretoken" value="form-token">'
+              '<input id="id_username" name="username"><input id="id_password" name="password">'
+              '</form></body></html>')
+
+
+class LoginServer(BaseHTTPRequestHandler):
+    """
+    Stands in for the game's login: a CSRF cookie and form token on GET /login/, a session cookie
+    and a 302 to /game/ for the right form, and the game page behind the session cookie.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/login/":
+            self.reply(200, LOGIN_PAGE, {"Set-Cookie": "csrftoken=cookie-token; Path=/"})
+        elif self.path == "/game/" and self.cookies().get("sessionid") == "s1":
+            self.reply(200, GAME_PAGE)
+        else:
+            self.reply(302, "", {"Location": "/login/"})
+
+    def do_POST(self):
+        form = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        if (self.path == "/login/" and self.cookies().get("csrftoken") == "cookie-token"
+                and form.get("csrfmiddlewaretoken") == ["form-token"]
+                and form.get("username") == ["zlef"] and form.get("password") == ["hunter2"]):
+            self.reply(302, "", {"Location": "/game/", "Set-Cookie": "sessionid=s1; Path=/"})
+        else:
+            self.reply(200, LOGIN_PAGE)
+
+    def cookies(self):
+        jar = SimpleCookie(self.headers.get("Cookie", ""))
+        return {name: morsel.value for name, morsel in jar.items()}
+
+    def reply(self, status, body, headers=None):
+        body = body.encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), LoginServer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fetch_signature_follows_the_login_redirect(server):
+    login = HttpLogin("zlef", "hunter2", base_url=server)
+    try:
+        assert login.fetch_signature() == SIGNATURE
+        # Again on the same kept-alive connection
+        assert login.fetch_signature() == SIGNATURE
+    finally:
+        login.close()
+
+
+def test_fetch_signature_rejected_login(server):
+    login = HttpLogin("zlef", "wrong", base_url=server)
+    try:
+        with pytest.raises(LoginError):
+            login.fetch_signature()
+    finally:
+        login.close()
+
+
+@pytest.mark.parametrize("size", range(1, 40))
+def test_scan_signature_across_chunk_boundaries(size):
+    chunks = [GAME_PAGE[at:at + size] for at in range(0, len(GAME_PAGE), size)]
+    assert scan_signature(chunks) == SIGNATURE
+
+
+def test_scan_signature_stops_at_the_first_script():
+    consumed = []
+    split = GAME_PAGE.index("start_game")
+
+    def chunks():
+        for chunk in (GAME_PAGE[:split], GAME_PAGE[split:]):
+            consumed.append(chunk)
+            yield chunk
+
+    assert scan_signature(chunks()) == SIGNATURE
+    assert len(consumed) == 1
+
+
+@pytest.mark.parametrize("page", [
+    "",
+    LOGIN_PAGE,
+    "<html><script>start_game(); var signature = 'too-late';</script></html>",
+    "<html><script>var signature = 'never closed",
+    "<html><script",
+    "<html><head><script src='/a.js'></script></head><body class='game'>Idle Pixel</body></html>",
+    "<html><script></script><p>It's loading; please wait</p></html>",
+])
+def test_scan_signature_without_a_signature(page):
+    with pytest.raises(LoginError):
+        scan_signature([page[at:at + 5] for at in range(0, len(page), 5)])
@@ -0,0 +1,193 @@
+"""
+Offline index of wiki page titles, redirects and section headings, built from a MediaWiki XML
+export (Special:Export or dumpBackup.php) so ?wiki can link straight to articles.
+
+    python wikiindex.py idle-pixel-wiki.xml [--db wiki_index.sqlite]
+
+Re-running against a newer dump only rewrites pages whose revision changed.
+"""
+import argparse
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET
+
+HEADING = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.MULTILINE)
+WORD = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    redirect TEXT,
+    revision INTEGER
+);
+CREATE TABLE IF NOT EXISTS sections (
+    page_id INTEGER NOT NULL,
+    heading_key TEXT NOT NULL,
+    heading TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_heading ON sections (heading_key);
+CREATE INDEX IF NOT EXISTS sections_page ON sections (page_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS titles USING fts5 (title);
+"""
+
+
+def normalize(title):
+    return " ".join(title.replace("_", " ").lower().split())
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def iter_pages(path):
+    """
+    Streams (title, redirect, revision, text) for main-namespace pages, clearing each page from
+    the tree once it has been read so memory stays flat however big the dump is.
+    """
+    context = ET.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end" or local_name(elem.tag) != "page":
+            continue
+        title = elem.findtext("{*}title")
+        namespace = elem.findtext("{*}ns", "0")
+        redirect = elem.find("{*}redirect")
+        redirect = redirect.get("title") if redirect is not None else None
+        revision, text = 0, ""
+        last_revision = elem.find("{*}revision")
+        if last_revision is not None:
+            revision = int(last_revision.findtext("{*}id", "0"))
+            text = last_revision.findtext("{*}text") or ""
+        root.clear()
+        if title and namespace == "0":
+            yield title, redirect, revision, text
+
+
+class WikiIndex:
+    """
+    Resolves search terms to article URLs from the local index: an exact title (following
+    redirects), then a unique section heading, then a full-text title match that points at a
+    single page. Anything less certain returns None so the caller can fall back to a search link.
+    """
+    ARTICLE_URL = "https://idle-pixel.wiki/index.php/"
+
+    def __init__(self, path="wiki_index.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def ingest(self, dump_path, batch_size=500):
+        """
+        Adds or updates every page in a dump. Returns (pages seen, pages written).
+        """
+        seen = written = 0
+        with self._lock:
+            cursor = self.db.cursor()
+            cursor.execute("BEGIN")
+            for title, redirect, revision, text in iter_pages(dump_path):
+                seen += 1
+                key = normalize(title)
+                row = cursor.execute("SELECT id, revision FROM pages WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] == revision:
+                    continue
+                if row is None:
+                    cursor.execute("INSERT INTO pages (key, title, redirect, revision) VALUES (?, ?, ?, ?)",
+                                   (key, title, redirect, revision))
+                    page_id = cursor.lastrowid
+                else:
+                    page_id = row[0]
+                    cursor.execute("UPDATE pages SET title = ?, redirect = ?, revision = ? WHERE id = ?",
+                                   (title, redirect, revision, page_id))
+                    cursor.execute("DELETE FROM sections WHERE page_id = ?", (page_id,))
+                    cursor.execute("DELETE FROM titles WHERE rowid = ?", (page_id,))
+                cursor.execute("INSERT INTO titles (rowid, title) VALUES (?, ?)", (page_id, title))
+                if redirect is None:
+                    cursor.executemany(
+                        "INSERT INTO sections (page_id, heading_key, heading) VALUES (?, ?, ?)",
+                        [(page_id, normalize(heading), heading) for _, heading in HEADING.findall(text)])
+                written += 1
+                if written % batch_size == 0:
+                    cursor.execute("COMMIT")
+                    cursor.execute("BEGIN")
+            cursor.execute("COMMIT")
+        return seen, written
+
+    def resolve(self, term, exact=True, fuzzy=True):
+        """
+        Returns (title, heading or None) for a term, or None without a confident match. `exact`
+        covers titles and redirects, `fuzzy` the section headings and full-text title search.
+        """
+        key = normalize(term)
+        if not key:
+            return None
+        with self._lock:
+            if exact:
+                row = self.db.execute("SELECT title, redirect FROM pages WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    return self._follow(*row)
+            if not fuzzy:
+                return None
+
+            rows = self.db.execute(
+                "SELECT pages.title, sections.heading FROM sections JOIN pages ON pages.id = sections.page_id "
+                "WHERE sections.heading_key = ? LIMIT 2", (key,)).fetchall()
+            if len(rows) == 1:
+                return rows[0]
+
+            words = WORD.findall(key)
+            if not words:
+                return None
+            query = " ".join(f'"{word}"' for word in words)
+            rows = self.db.execute(
+                "SELECT pages.title, pages.redirect FROM titles JOIN pages ON pages.id = titles.rowid "
+                "WHERE titles MATCH ? ORDER BY rank LIMIT 5", (query,)).fetchall()
+            targets = {self._follow(title, redirect) for title, redirect in rows}
+            if len(targets) == 1:
+                return targets.pop()
+            return None
+
+    def url_for(self, term, exact=True, fuzzy=True):
+        """
+        Returns the article URL for a term, or None if the index isn't sure.
+        """
+        match = self.resolve(term, exact, fuzzy)
+        if match is None:
+            return None
+        title, heading = match
+        url = self.ARTICLE_URL + urllib.parse.quote(title.replace(" ", "_"), safe="/:()")
+        if heading:
+            url += "#" + urllib.parse.quote(heading.replace(" ", "_"), safe="/:()")
+        return url
+
+    def _follow(self, title, redirect):
+        if redirect is None:
+            return title, None
+        target, _, heading = redirect.partition("#")
+        row = self.db.execute("SELECT title FROM pages WHERE key = ?", (normalize(target),)).fetchone()
+        return (row[0] if row else target), (heading or None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dump", help="MediaWiki XML export")
+    parser.add_argument("--db", default="wiki_index.sqlite", help="index to create or update")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    index = WikiIndex(args.db)
+    seen, written = index.ingest(args.dump)
+    index.close()
+    print(f"Indexed {seen} pages ({written} new or changed) into {args.db} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Runs commands in worker processes instead of threads, so CPU-heavy handlers are not serialised
+by the GIL. Set "worker_processes" in config.json to enable it.
+
+Shortcuts and the user lists live in a SQLite database in WAL mode that every process opens. Each
+worker runs its own copy of the bot against that database and hands back what the command said;
+the parent sends it on the connection the command came from and writes any config changes to
+config.json. Rate limits are checked in the parent, which sees every command, against its own
+windows in memory before the command is handed to a worker.
+"""
+import asyncio
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from acl import Role
+from botlog import forward_logging
+from metrics import Metrics
+
+worker_log = logging.getLogger("wikibot.workers")
+
+# Bot attributes the commands read or change. They are sent with every command and changes come back.
+FLAGS = ("debug", "testing", "force_local", "jokes", "fakename", "nades", "last_joke")
+
+
+class SharedState:
+    """
+    The parts of the config that commands change, in a SQLite file any number of processes can
+    use at once. Writers take the database lock for the length of one
+    short transaction; readers never wait.
+
+    Offers the same set_item/delete_item/add_member/remove_member calls as ConfigStore. Changes
+    made through them are kept in `ops` so the parent can persist them.
+    """
+    SECTIONS = {"shortcuts": dict, "blacklist": list, "whitelist": list, "alttraderlist": list}
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (section TEXT, key TEXT, value TEXT, PRIMARY KEY (section, key));
+            CREATE TABLE IF NOT EXISTS meta (version INTEGER);
+        """)
+        self._lock = threading.Lock()
+        self.document = None
+        self.version_seen = None
+        self.ops = []
+
+    def seed(self, document):
+        """
+        Replaces the shared state with the given config document.
+        """
+        with self._transaction():
+            self.db.execute("DELETE FROM entries")
+            for section, kind in self.SECTIONS.items():
+                members = document[section].items() if kind is dict else ((name, None) for name in document[section])
+                self.db.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?, ?)",
+                                    ((section, key, value) for key, value in members))
+            self._bump()
+
+    def load(self):
+        with self._transaction(begin="BEGIN"):
+            document = {section: kind() for section, kind in self.SECTIONS.items()}
+            for section, key, value in self.db.execute("SELECT section, key, value FROM entries ORDER BY rowid"):
+                if isinstance(document[section], dict):
+                    document[section][key] = value
+                else:
+                    document[section].append(key)
+            self.version_seen = self.version()
+        self.document = document
+        return document
+
+    def version(self):
+        row = self.db.execute("SELECT version FROM meta").fetchone()
+        return row[0] if row else 0
+
+    def set_item(self, section, key, value):
+        self._change("set_item", (section, key, value),
+                     "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (section, key, value))
+        self.document[section][key] = value
+
+    def delete_item(self, section, key):
+        self._change("delete_item", (section, key),
+                     "DELETE FROM entries WHERE section = ? AND key = ?", (section, key))
+        self.document[section].pop(key, None)
+
+    def add_member(self, section, value):
+        self._change("add_member", (section, value),
+                     "INSERT OR IGNORE INTO entries VALUES (?, ?, NULL)", (section, value))
+        if value not in self.document[section]:
+            self.document[section].append(value)
+
+    def remove_member(self, section, value):
+        self._change("remove_member", (section, value),
+                     "DELETE FROM entries WHERE section = ? AND key = ?", (section, value))
+        if value in self.document[section]:
+            self.document[section].remove(value)
+
+    def close(self):
+        self.db.close()
+
+    def _change(self, method, params, statement, values):
+        with self._transaction():
+            self.db.execute(statement, values)
+            changed_from = self.version()
+            self._bump()
+        # Unless someone else got in first, our copy is still current
+        if changed_from == self.version_seen:
+            self.version_seen = changed_from + 1
+        self.ops.append((method, params))
+
+    def _bump(self):
+        if self.db.execute("UPDATE meta SET version = version + 1").rowcount == 0:
+            self.db.execute("INSERT INTO meta VALUES (1)")
+
+    @contextmanager
+    def _transaction(self, begin="BEGIN IMMEDIATE"):
+        with self._lock:
+            self.db.execute(begin)
+            try:
+                yield
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+
+class AdmittedByParent:
+    """
+    The rate limiter inside a worker. The parent checks every command against its own windows
+    before sending it over, so anything that gets here has already been counted.
+    """
+
+    def admit(self, username, command):
+        return None
+
+    def summary(self):
+        return "Rate limits are kept by the parent process."
+
+
+class Outbox:
+    """
+    Stands in for the connection, the admin echo and the reply coalescer inside a worker,
+    collecting what a command sends. Replies are (message, force_debug), with force_debug None
+    for a frame sent as it is; the parent turns the rest into CHAT or CUSTOM frames itself, so
+    CUSTOM callback ids come from one counter.
+    """
+
+    def __init__(self):
+        self.replies = []
+        self.echoes = []
+        self.coalesced = []
+
+    def send(self, message):
+        self.replies.append((message, None))
+
+    def respond(self, message, force_debug=False):
+        self.replies.append((message, force_debug))
+
+    def add(self, line):
+        self.echoes.append(line)
+
+    def coalesce(self, term, username, link, route=None):
+        self.coalesced.append((term, username, link))
+
+    def drain(self):
+        drained = self.replies, self.echoes, self.coalesced
+        self.replies, self.echoes, self.coalesced = [], [], []
+        return drained
+
+
+class WorkerBot:
+    """
+    Mixed in ahead of the bot class inside a worker: config comes from the file plus SharedState,
+    there is no connection, and replies go to an Outbox.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.outbox = Outbox()
+        super().__init__()
+        self.admin_echo = self.outbox
+        self.reply_coalescer = self.outbox
+        self.rate_limiter = AdmittedByParent()
+
+    def load_config(self):
+        self.metrics = Metrics()
+        with open(self.CONFIG_PATH, "r") as f:
+            config = json.load(f)
+        config.update(self.state.load())
+        self.store = self.state
+        self.apply_config(config)
+        self.build_indexes()
+        for name, level in config.get("logging", {}).get("levels", {}).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+    def make_socket_handlers(self):
+        return [self.outbox]
+
+    def send_response(self, message, force_debug=False, route=None):
+        self.outbox.respond(message, force_debug)
+
+    def refresh(self):
+        """
+        Picks up shortcut and user list changes made by other processes.
+        """
+        if self.state.version() == self.state.version_seen:
+            return
+        document = self.state.load()
+        for section in SharedState.SECTIONS:
+            setattr(self, section, document[section])
+        self.build_indexes()
+
+
+_bot = None
+
+
+def _start_worker(bot_class, config_path, state_path, log_queue):
+    global _bot
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    bot_class.CONFIG_PATH = config_path
+    worker_class = type(f"Worker{bot_class.__name__}", (WorkerBot, bot_class), {})
+    _bot = worker_class(SharedState(state_path))
+
+
+def _run_command(command_name, args, kwargs, flags, last_jokes):
+    bot = _bot
+    bot.refresh()
+    for name, value in flags.items():
+        bot.set_flag(name, value)
+    for username, joke in last_jokes.items():
+        bot.players.record(username).last_joke = joke
+    try:
+        bot.dispatch(command_name, *args, **kwargs)
+    except Exception:
+        worker_log.exception(f"Command {command_name} failed")
+    ops, bot.state.ops = bot.state.ops, []
+    replies, echoes, coalesced = bot.outbox.drain()
+    # Counters (rejections and the like) are handed to the parent rather than kept here
+    counters, bot.metrics = bot.metrics.counters(), Metrics()
+    return (replies, echoes, coalesced, ops, counters, {name: getattr(bot, name) for name in flags},
+            {username: bot.players.record(username).last_joke for username in last_jokes})
+
+
+class WorkerPool:
+    """
+    The parent's side: seeds SharedState from the config, starts the processes and applies what
+    comes back from each command.
+    """
+    ROLES = {"blacklist": Role.BLACKLISTED, "whitelist": Role.WHITELISTED, "alttraderlist": Role.ALT_TRADER}
+
+    def __init__(self, bot, processes, state_path):
+        self.bot = bot
+        self.state = SharedState(state_path)
+        self.state.seed(bot.store.document)
+        self.processes = processes
+        self.state_path = state_path
+        self.context = multiprocessing.get_context("spawn")
+        self.log_queue = self.context.Queue()
+        forward_logging(self.log_queue)
+        self.pool = self._start()
+
+    def _start(self):
+        pool = ProcessPoolExecutor(self.processes, mp_context=self.context, initializer=_start_worker,
+                                   initargs=(type(self.bot), self.bot.CONFIG_PATH, self.state_path, self.log_queue))
+        worker_log.info(f"Started {self.processes} worker processes sharing {self.state_path}")
+        return pool
+
+    def restart(self):
+        """
+        Swaps in fresh worker processes, which import the command modules as they are on disk now.
+        Commands already running on the old ones finish there.
+        """
+        old, self.pool = self.pool, self._start()
+        old.shutdown(wait=False)
+
+    async def run(self, command_name, args, kwargs):
+        bot = self.bot
+        if not bot.command_map[command_name].admit(args[0]):
+            return
+        flags = {name: getattr(bot, name) for name in FLAGS}
+        # The last joke told to whoever the command may answer as, so workers don't repeat it
+        players = [bot.players.record(args[0])]
+        if bot.testing:
+            players.append(bot.players.record(bot.fakename))
+        last_jokes = {player.name: player.last_joke for player in players}
+        loop = asyncio.get_running_loop()
+        replies, echoes, coalesced, ops, counters, after, last_jokes = await loop.run_in_executor(
+            self.pool, _run_command, command_name, args, kwargs, flags, last_jokes)
+        for (name, labels), value in counters.items():
+            bot.metrics.inc(name, labels, value)
+        for name, value in after.items():
+            if value != flags[name]:
+                bot.set_flag(name, value)
+        for method, params in ops:
+            getattr(bot.store, method)(*params)
+            self._apply(method, params)
+        for player in players:
+            player.last_joke = last_jokes[player.name]
+        route = bot.reply_handler()
+        for message, force_debug in replies:
+            if force_debug is None:
+                route.send(message)
+            else:
+                bot.send_response(message, force_debug, route)
+        for line in echoes:
+            bot.admin_echo.add(line)
+        for term, username, link in coalesced:
+            bot.reply_coalescer.coalesce(term, username, link, route)
+
+    def _apply(self, method, params):
+        """
+        Brings the parent's indexes up to date with one change a worker made, the way the command
+        itself does in a single process.
+        """
+        bot = self.bot
+        section = params[0]
+        if section == "shortcuts":
+            key = params[1]
+            if method == "set_item":
+                bot.shortcut_index.add(key, params[2])
+                bot.key_pages.add(key)
+            else:
+                bot.shortcut_index.remove(key)
+                bot.key_pages.remove(key)
+            bot.link_cache.clear()
+        elif method == "add_member":
+            bot.acl.add(self.ROLES[section], params[1])
+        else:
+            bot.acl.remove(self.ROLES[section], params[1])
+
+    def close(self):
+        self.pool.shutdown()
+        self.state.close()